@@ -0,0 +1,334 @@
+import asyncio
+import json
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from bot import Bot
+from telegram_objects import Message
+
+# Most seconds polling waits after repeated errors when Telegram does not say how long to wait
+MAX_POLL_BACKOFF = 60
+
+class AsyncBot(Bot):
+	"""
+	Bot variant that runs polling, dispatching and the outbound request queue as coroutines on a single asyncio event loop.
+	Selected by setting runtime="async" within the bot's configuration file.
+
+	Plugins remain synchronous, so their on_command and on_message methods are run on a fixed size pool of worker threads
+	instead of a new thread per message. Requests made by plugins through api_call (send_message, send_photo, ...) are
+	placed on the outbound queue and sent by the event loop.
+
+	...
+
+	Methods
+	-------
+	run()
+		Coroutine that polls Telegram and dispatches updates until stop() is called.
+
+	stop()
+		Requests the event loop to stop polling. Safe to call from any thread.
+
+	dispatch(message)
+		Schedules a received Message to be processed by the PluginManager on a worker thread.
+
+	api_call(method, params, data, files)
+		Queues a request to a Telegram Bot API method to be sent by the event loop.
+
+	on_config_reload(config, changed)
+		Applies changed settings, resizing the worker pool and number of senders if workers changed.
+	"""
+
+	def __init__(self, config):
+		"""
+		Sets up the same bot data as Bot along with the async runtime settings.
+
+		...
+
+		Parameters
+		----------
+		config: Config
+			Configuration object containing data found within the bot's configuration file.
+		"""
+
+		Bot.__init__(self, config)
+		self.poll_timeout = config.poll_timeout
+		self.workers = config.workers
+		self.loop = None
+		self.session = None
+		self.executor = None
+		self.outbound = None
+		self.senders = set()
+		self.retiring = 0
+		self.pending = set()
+		self._stop_event = None
+
+	async def run(self):
+		"""
+		Receives messages from Telegram and sends replies until stop() is called.
+		Once stopped, plugins still processing messages are waited on and the outbound queue is drained before returning.
+		"""
+
+		self.loop = asyncio.get_running_loop()
+		self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="plugin")
+		self.loop.set_default_executor(self.executor)
+		self.outbound = asyncio.Queue()
+		self._stop_event = asyncio.Event()
+
+		# Concurrency is bounded by the number of senders rather than the connector, so it can be resized at runtime
+		connector = aiohttp.TCPConnector(limit=0)
+
+		async with aiohttp.ClientSession(connector=connector) as session:
+			self.session = session
+			self._resize_workers(self.workers)
+
+			try:
+				await self._poll_loop()
+			finally:
+				if self.pending:
+					await asyncio.wait(set(self.pending))
+				await self.outbound.join()
+
+				senders = list(self.senders)
+				for sender in senders:
+					sender.cancel()
+				await asyncio.gather(*senders, return_exceptions=True)
+				self.session = None
+
+		self.logger.warning("Ending telegram update loop due to the event loop being stopped")
+
+	def stop(self):
+		"""
+		Requests the event loop to stop polling. Safe to call from any thread.
+		"""
+
+		if self.loop and self._stop_event:
+			self.loop.call_soon_threadsafe(self._stop_event.set)
+
+	def dispatch(self, message):
+		"""
+		Schedules a received Message to be processed by the PluginManager on a worker thread.
+
+		...
+
+		Parameters
+		----------
+		message: Message
+			Message object detailing command, message, and Telegram user info
+		"""
+
+		if message.is_command:
+			self.logger.info("Command received, processing plugins")
+			handler = self.plugin_manager.process_plugin
+		else:
+			handler = self.plugin_manager.process_message
+
+		future = self.loop.run_in_executor(None, handler, self, message)
+		self.pending.add(future)
+		future.add_done_callback(self.pending.discard)
+
+	def api_call(self, method, params=None, data=None, files=None):
+		"""
+		Queues a request to a Telegram Bot API method to be sent by the event loop.
+		Files are read on the calling thread so the event loop never blocks on disk access.
+		Falls back to a blocking request when the event loop is not running.
+
+		...
+
+		Parameters
+		----------
+		method: str
+			The name of the Telegram Bot API method (ex. sendMessage)
+
+		params: dict, optional
+			Query string parameters sent with the request
+
+		data: dict, optional
+			Form data sent with the request
+
+		files: dict, optional
+			Map of form field names to open files, or (file name, bytes) tuples, uploaded with the request
+		"""
+
+		if not self.loop or self.loop.is_closed():
+			return Bot.api_call(self, method, params, data, files)
+
+		fields = []
+		for values in (params, data):
+			if values:
+				for key, value in values.items():
+					if value is None:
+						continue
+					if isinstance(value, (list, dict)):
+						value = json.dumps(value)
+					fields.append((key, str(value)))
+
+		uploads = []
+		if files:
+			for key, f in files.items():
+				if isinstance(f, tuple):
+					uploads.append((key,) + f)
+					continue
+				with f:
+					uploads.append((key, os.path.basename(f.name), f.read()))
+
+		self.loop.call_soon_threadsafe(self.outbound.put_nowait, (method, fields, uploads))
+
+	def on_config_reload(self, config, changed):
+		"""
+		Applies changed settings after the configuration file has been reloaded, resizing the worker pool and
+		number of senders if workers changed.
+
+		...
+
+		Parameters
+		----------
+		config: Config
+			The reloaded configuration object
+
+		changed: list of str
+			Names of the settings that changed
+		"""
+
+		Bot.on_config_reload(self, config, changed)
+		self.poll_timeout = config.poll_timeout
+
+		if "workers" in changed and self.loop and not self.loop.is_closed():
+			self.loop.call_soon_threadsafe(self._resize_workers, config.workers)
+
+	def _resize_workers(self, workers):
+		"""
+		Resizes the plugin worker pool and the number of sender coroutines. Must be called on the event loop.
+		"""
+
+		if workers != self.workers:
+			old_executor = self.executor
+			self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plugin")
+			self.loop.set_default_executor(self.executor)
+			# Plugins already running on the old pool are left to finish
+			old_executor.shutdown(wait=False)
+			self.workers = workers
+			self.logger.info("Resized plugin workers and senders to {}".format(workers))
+
+		while len(self.senders) - self.retiring < workers:
+			sender = asyncio.create_task(self._send_loop())
+			self.senders.add(sender)
+			sender.add_done_callback(self.senders.discard)
+
+		# Surplus senders exit once they reach a None placed on the queue
+		for i in range(len(self.senders) - self.retiring - workers):
+			self.retiring += 1
+			self.outbound.put_nowait(None)
+
+	async def _poll_loop(self):
+		"""
+		Long polls Telegram for updates and dispatches every received message until stopped.
+		"""
+
+		last_update = 0
+		failures = 0
+		stopped = asyncio.create_task(self._stop_event.wait())
+
+		while not self._stop_event.is_set():
+			poll = asyncio.create_task(self._get_updates(last_update))
+			await asyncio.wait({poll, stopped}, return_when=asyncio.FIRST_COMPLETED)
+
+			if not poll.done():
+				poll.cancel()
+				break
+
+			try:
+				updates = poll.result()
+			except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+				failures += 1
+				delay = self._poll_backoff(failures)
+				self.logger.exception("Unable to get updates, retrying in {} seconds".format(delay))
+				await asyncio.wait({stopped}, timeout=delay)
+				continue
+
+			# Telegram answers errors such as 429 (too many requests) with ok set to false and no result
+			if not updates.get("ok") or "result" not in updates:
+				failures += 1
+				delay = updates.get("parameters", {}).get("retry_after") or self._poll_backoff(failures)
+				self.logger.warning("Telegram refused getUpdates ({}: {}), retrying in {} seconds".format(
+					updates.get("error_code"), updates.get("description"), delay))
+				await asyncio.wait({stopped}, timeout=delay)
+				continue
+			failures = 0
+
+			for update in updates["result"]:
+				last_update = update["update_id"]
+
+				if "message" in update:
+					message = Message(update["message"])
+					self.logger.info(str(last_update)+": "+message.sent_from.username)
+					self.dispatch(message)
+
+		stopped.cancel()
+
+	async def _get_updates(self, last_update):
+		"""
+		Coroutine that long polls Telegram for message updates received after last_update.
+		Returns Telegram's decoded reply, with ok set to false if the request failed with another status than 200.
+		"""
+
+		params = dict(offset=(last_update+1), timeout=self.poll_timeout)
+		timeout = aiohttp.ClientTimeout(total=self.poll_timeout + self.config.request_timeout)
+
+		async with self.session.get(self.base_url + 'getUpdates', params=params, timeout=timeout) as response:
+			text = await response.text()
+
+			try:
+				updates = json.loads(text)
+			except ValueError:
+				if response.status == 200:
+					raise
+				updates = {"description": text}
+
+			if response.status != 200:
+				updates["ok"] = False
+				updates.setdefault("error_code", response.status)
+			return updates
+
+	def _poll_backoff(self, failures):
+		"""
+		Returns the seconds to wait before polling again after failures consecutive errors, doubling with each one.
+		"""
+
+		return min(max(self.sleep_interval, 1) * 2 ** (failures - 1), MAX_POLL_BACKOFF)
+
+	async def _send_loop(self):
+		"""
+		Coroutine that sends queued requests to Telegram forever.
+		"""
+
+		while True:
+			request = await self.outbound.get()
+
+			if request is None:
+				self.retiring -= 1
+				self.outbound.task_done()
+				return
+
+			method, fields, uploads = request
+
+			try:
+				if method.startswith("send"):
+					await asyncio.sleep(self.limiter.reserve())
+
+				form = aiohttp.FormData()
+				for key, value in fields:
+					form.add_field(key, value)
+				for key, file_name, payload in uploads:
+					form.add_field(key, payload, filename=file_name)
+
+				timeout = aiohttp.ClientTimeout(total=self.config.request_timeout)
+				async with self.session.post(self.base_url + method, data=form, timeout=timeout) as response:
+					if response.status != 200:
+						self.logger.warning("Telegram rejected {} with status {}: {}".format(method, response.status, await response.text()))
+			except (aiohttp.ClientError, asyncio.TimeoutError):
+				self.logger.exception("Unable to send {} to Telegram".format(method))
+			finally:
+				self.outbound.task_done()
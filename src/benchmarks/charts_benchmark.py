@@ -0,0 +1,69 @@
+"""
+Compares the chart renderers within libs/charts.py on datasets shaped like the activity charts drawn by /plot.
+
+Run from the src directory: python benchmarks/charts_benchmark.py [repeats]
+"""
+
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs import charts
+
+# Name, number of points, spacing between points and tick label format of each dataset
+DATASETS = [
+    ("day (hourly)", 48, timedelta(hours=1), "%m-%d %H:00"),
+    ("month (daily)", 30, timedelta(days=1), "%Y-%m-%d"),
+    ("year (daily)", 365, timedelta(days=1), "%Y-%m-%d"),
+    ("five years (daily)", 5 * 365, timedelta(days=1), "%Y-%m-%d"),
+]
+
+
+def dataset(points, spacing):
+    rng = random.Random(points)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    dates = [start + spacing * i for i in range(points)]
+    # Bursty activity, like a group chat with quiet and busy periods
+    values = [int(rng.expovariate(1 / 2000)) for _ in range(points)]
+    return dates, values
+
+
+def import_time(module):
+    """
+    Returns the seconds a fresh interpreter takes to import module, which the bot pays once per process.
+    """
+
+    code = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)".format(module)
+    return float(subprocess.check_output([sys.executable, "-c", code]).decode())
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print("Cold import")
+    print("  {:<12} {:>8.1f} ms".format("pillow", import_time("PIL.ImageDraw") * 1000))
+    print("  {:<12} {:>8.1f} ms".format("matplotlib", import_time("matplotlib.pyplot") * 1000))
+
+    print("Render, mean of {} runs".format(repeats))
+    for name, points, spacing, date_format in DATASETS:
+        dates, values = dataset(points, spacing)
+
+        for renderer in charts.RENDERERS:
+            # Warm up so one-off imports and font loading are not counted
+            charts.line_chart(dates, values, "Activity", "Date", "length", date_format, renderer)
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                size = len(charts.line_chart(dates, values, "Activity", "Date", "length", date_format, renderer))
+            elapsed = (time.perf_counter() - start) / repeats
+
+            print("  {:<20} {:<12} {:>8.1f} ms {:>8} bytes".format(name, renderer, elapsed * 1000, size))
+
+
+if __name__ == "__main__":
+    main()
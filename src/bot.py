@@ -8,6 +8,7 @@ import os
 
 from telegram_objects import Command, User, Chat, Message
 from plugin_manager import PluginManager
+from rate_limiter import RateLimiter
 
 class Bot:
 	"""
@@ -36,6 +37,21 @@ class Bot:
 	list_plugins()
 		Returns a str listing all plugins
 
+	reload_config()
+		Rereads the configuration file, applying changed settings without a restart
+
+	start_profiler(id, mode, duration, top)
+		Starts profiling plugins for a window of time, sending the report to a chatroom once finished
+
+	stop_profiler()
+		Stops profiling plugins early, returning the report
+
+	shutdown()
+		Flushes and closes resources held by all plugins
+
+	api_call(method, params, data, files)
+		Performs a request against a Telegram Bot API method.
+
 	get_updates(last_update)
 		Gets message updates from Telegram based on those last received.
 
@@ -58,11 +74,14 @@ class Bot:
 		"""
 
 		self.logger = logging.getLogger('bot_log')
+		self.config = config
 		self.directory = config.bot_dir
-		self.base_url = "https://api.telegram.org/bot"+config.token+"/"
+		self.base_url = config.api_url+"/bot"+config.token+"/"
 		self.sleep_interval = config.sleep_interval
-		self.username = json.loads(requests.get(self.base_url + "getMe").text)["result"]["username"]
+		self.limiter = RateLimiter(config.send_rate_limit)
+		self.username = json.loads(requests.get(self.base_url + "getMe", timeout=config.request_timeout).text)["result"]["username"]
 		self.plugin_manager = PluginManager(config, self)
+		config.subscribe(self.on_config_reload)
 
 		print(self.plugin_manager.list_commands())
 		print(self.plugin_manager.list_listeners())
@@ -136,6 +155,85 @@ class Bot:
 		self.logger.info("Request recieved to list all plugins")
 		return self.plugin_manager.list_plugins()
 
+	def reload_config(self):
+		"""
+		Rereads the configuration file, applying changed settings without a restart.
+		Returns a list of the names of settings that changed.
+		"""
+
+		self.logger.info("Request received to reload the config")
+		return self.config.reload()
+
+	def on_config_reload(self, config, changed):
+		"""
+		Applies changed settings after the configuration file has been reloaded
+
+		...
+
+		Parameters
+		----------
+		config: Config
+			The reloaded configuration object
+
+		changed: list of str
+			Names of the settings that changed
+		"""
+
+		self.sleep_interval = config.sleep_interval
+		self.limiter.set_rate(config.send_rate_limit)
+
+	def start_profiler(self, id, mode, duration, top):
+		"""
+		Starts profiling plugins for duration seconds, sending the report to the chatroom with the designated id once finished.
+		Returns False if profiling is already running or the mode is invalid.
+		"""
+
+		self.logger.info("Request received to profile plugins ({}) for {} seconds".format(mode, duration))
+		return self.plugin_manager.profiler.start(mode, duration, top, lambda report: self.send_message(id, report))
+
+	def stop_profiler(self):
+		"""
+		Stops profiling plugins early, returning the report or None if profiling was not running
+		"""
+
+		self.logger.info("Request received to stop profiling plugins")
+		return self.plugin_manager.profiler.stop()
+
+	def shutdown(self):
+		"""
+		Flushes and closes resources held by all plugins
+		"""
+
+		self.logger.info("Closing all plugins")
+		self.plugin_manager.shutdown()
+
+	def api_call(self, method, params=None, data=None, files=None):
+		"""
+		Performs a request against a Telegram Bot API method and returns the response.
+		Send requests are spaced out to respect the configured send_rate_limit.
+
+		...
+
+		Parameters
+		----------
+		method: str
+			The name of the Telegram Bot API method (ex. sendMessage)
+
+		params: dict, optional
+			Query string parameters sent with the request
+
+		data: dict, optional
+			Form data sent with the request
+
+		files: dict, optional
+			Map of form field names to open files, or (file name, bytes) tuples, uploaded with the request
+		"""
+
+		if method.startswith("send"):
+			time.sleep(self.limiter.reserve())
+
+		return requests.get(self.base_url + method, params=params, data=data, files=files, timeout=self.config.request_timeout)
+
 	def get_updates(self, last_update):
 		"""
 		Gets message updates from Telegram based on those last received.
@@ -148,7 +246,7 @@ class Bot:
 			Data received from telegram dictating new messages that were send/visible to the bot.
 		"""
 
-		return json.loads(requests.get(self.base_url + 'getUpdates', params=dict(offset=(last_update+1))).text)
+		return json.loads(requests.get(self.base_url + 'getUpdates', params=dict(offset=(last_update+1)), timeout=self.config.request_timeout).text)
 
 	def send_message(self, id, message):
 		"""
@@ -166,11 +264,12 @@ class Bot:
 		"""
 
 		self.logger.info("Sending message ({}) to channel with id {}".format(message, id))
-		return requests.get(self.base_url + 'sendMessage', params=dict(chat_id=id, text=message))
+		return self.api_call('sendMessage', params=dict(chat_id=id, text=message))
 
-	def send_photo(self, id, caption, file_path):
+	def send_photo(self, id, caption, file_path, photo=None):
 		"""
 		Sends a photo found with the designated filename with an optional caption string message to a chatroom containing the designated id
+		When photo bytes are given they are uploaded under the file path's name without reading the file.
 
 		...
 
@@ -184,13 +283,16 @@ class Bot:
 
 		file_path: str
 			The file path of the photo to send to a Telegram chatroom
+
+		photo: bytes, optional
+			The encoded photo to send instead of the file at file_path
 		"""
 
-		path = {'photo': open(file_path, 'rb')}
+		path = {'photo': (os.path.basename(file_path), photo) if photo is not None else open(file_path, 'rb')}
 		data = dict(chat_id=id, caption=caption)
 
 		self.logger.info("Sending photo with caption ({}) with path ({}) to channel with id {}".format(caption, file_path, id))
-		return requests.get(self.base_url + 'sendPhoto', files=path, data=data)
+		return self.api_call('sendPhoto', files=path, data=data)
 
 	def send_audio(self, id, caption, file_path):
 		"""
@@ -214,7 +316,7 @@ class Bot:
 		data = dict(chat_id=id, caption=caption)
 
 		self.logger.info("Sending audio with caption ({}) with path ({}) to channel with id {}".format(caption, file_path, id))
-		return requests.get(self.base_url + 'sendAudio', files=path, data=data)
+		return self.api_call('sendAudio', files=path, data=data)
 
 	def send_document(self, id, caption, file_path):
 		"""
@@ -238,7 +340,7 @@ class Bot:
 		data = dict(chat_id=id, caption=caption)
 
 		self.logger.info("Sending document with caption ({}) with path ({}) to channel with id {}".format(caption, file_path, id))
-		return requests.get(self.base_url + 'sendDocument', files=path, data=data)
+		return self.api_call('sendDocument', files=path, data=data)
 
 	def send_video(self, id, caption, file_path):
 		"""
@@ -262,7 +364,7 @@ class Bot:
 		data = dict(chat_id=id, caption=caption)
 
 		self.logger.info("Sending video with caption ({}) with path ({}) to channel with id {}".format(caption, file_path, id))
-		return requests.get(self.base_url + 'sendVideo', files=path, data=data)
+		return self.api_call('sendVideo', files=path, data=data)
 	
 	def send_animation(self, id, caption, file_path):
 		"""
@@ -286,7 +388,7 @@ class Bot:
 		data = dict(chat_id=id, caption=caption)
 
 		self.logger.info("Sending animation with caption ({}) with path ({}) to channel with id {}".format(caption, file_path, id))
-		return requests.get(self.base_url + 'sendAnimation', files=path, data=data)
+		return self.api_call('sendAnimation', files=path, data=data)
 
 	def send_voice(self, id, caption, file_path):
 		"""
@@ -310,7 +412,7 @@ class Bot:
 		data = dict(chat_id=id, caption=caption)
 
 		self.logger.info("Sending voice with caption ({}) with path ({}) to channel with id {}".format(caption, file_path, id))
-		return requests.get(self.base_url + 'sendVoice', files=path, data=data)
+		return self.api_call('sendVoice', files=path, data=data)
 
 	def send_location(self, id, latitude, longitude):
 		"""
@@ -333,7 +435,7 @@ class Bot:
 		data = dict(chat_id=id, latitude=latitude, longitude=longitude)
 
 		self.logger.info("Sending location with latitude ({}) and longitude ({}) to channel with id {}".format(latitude, longitude, id))
-		return requests.get(self.base_url + 'sendLocation', data=data)
+		return self.api_call('sendLocation', data=data)
 
 	def send_poll(self, id, question, options):
 		"""
@@ -356,7 +458,7 @@ class Bot:
 		data = dict(chat_id=id, question=question, options=options)
 
 		self.logger.info("Sending poll with question ({}) to channel with id {}".format(question, id))
-		return requests.get(self.base_url + 'sendPoll', data=data)
+		return self.api_call('sendPoll', data=data)
 
 	def kick_chat_member(self, id, user_id, until_date):
 		"""
@@ -383,7 +485,7 @@ class Bot:
 		data = dict(chat_id=id, user_id=user_id, until_date=until_date)
 
 		self.logger.info("Kicking user with id ({}) for ({}) seconds, from channel with id {}".format(user_id, until_date, id))
-		return requests.get(self.base_url + 'kickChatMember', data=data)
+		return self.api_call('kickChatMember', data=data)
 
 	def unban_chat_member(self, id, user_id):
 		"""
@@ -403,7 +505,7 @@ class Bot:
 		data = dict(chat_id=id, user_id=user_id)
 
 		self.logger.info("Unbanning user with id ({}) from channel with id {}".format(user_id, id))
-		return requests.get(self.base_url + 'unbanChatMember', data=data)
+		return self.api_call('unbanChatMember', data=data)
 
 	def restrict_chat_member(self, id, user_id, permissions, until_date):
 		"""
@@ -433,4 +535,4 @@ class Bot:
 		data = dict(chat_id=id, user_id=user_id, permissions=permissions, until_date=until_date)
 
 		self.logger.info("Restricting user with id ({}) for ({}) seconds, from channel with id {}".format(user_id, until_date, id))
-		return requests.get(self.base_url + 'restrictChatMember', data=data)
+		return self.api_call('restrictChatMember', data=data)
@@ -1,21 +1,114 @@
+import logging
 import re
 import os
+import threading
+
+class Setting:
+	"""
+	Describes a single setting found within the configuration file.
+
+	...
+
+	Properties
+	----------
+	self.name: str
+		Name of the setting within the configuration file and on the Config object.
+
+	self.parse: function
+		Converts the str found within the configuration file or environment into the setting's value.
+
+	self.default: object or function
+		Value used when the setting is missing, or a function returning it. None marks the setting as required.
+
+	self.check: function
+		Returns an error str if a parsed value is invalid, otherwise None.
+
+	self.reloadable: bool
+		Whether changes to this setting are applied by Config.reload() or require a restart.
+	"""
+
+	def __init__(self, name, parse, default, check=None, reloadable=True):
+		self.name = name
+		self.parse = parse
+		self.default = default
+		self.check = check
+		self.reloadable = reloadable
+
+	def get_default(self):
+		return self.default() if callable(self.default) else self.default
+
+
+def parse_list(value):
+	return [item.strip() for item in value.split(",") if item.strip()]
+
+def at_least(minimum):
+	return lambda value: None if value >= minimum else "must be at least {}".format(minimum)
+
+def one_of(*choices):
+	return lambda value: None if value in choices else "must be one of {}".format(", ".join(choices))
+
+
+# All settings read from the configuration file, in the order they are written out
+SETTINGS = [
+	Setting("token", str, None, reloadable=False),
+	Setting("bot_dir", str, lambda: os.path.abspath(''), reloadable=False),
+	Setting("sleep_interval", int, 2, at_least(0)),
+	# Runtime running the bot: "thread" (BotThread) or "async" (AsyncBot)
+	Setting("runtime", str, "thread", one_of("thread", "async"), reloadable=False),
+	Setting("api_url", lambda value: value.rstrip("/"), "https://api.telegram.org", reloadable=False),
+	# Seconds Telegram may hold a getUpdates request open when long polling
+	Setting("poll_timeout", int, 30, at_least(0)),
+	# Seconds before a request to Telegram is abandoned
+	Setting("request_timeout", float, 30.0, at_least(1)),
+	# Size of the plugin worker, executor, HTTP and database pools
+	Setting("workers", int, 4, at_least(1)),
+	# Maximum requests per second sent to Telegram, 0 disables the limit
+	Setting("send_rate_limit", float, 30.0, at_least(0)),
+	# Seconds and number of changed keys after which plugin stores are written to disk
+	Setting("store_flush_interval", float, 5.0, at_least(0.1)),
+	Setting("store_batch_size", int, 500, at_least(1)),
+	# Maximum number of entries within the cache shared by plugins
+	Setting("cache_size", int, 1024, at_least(1)),
+	# Seconds between stack samples taken by /profile in sampling mode
+	Setting("profile_sample_interval", float, 0.005, at_least(0.001)),
+	# Ledger backend used by libs/bank.py: "sqlite" (bank.db) or "journal" (bank.journal)
+	Setting("bank_backend", str, "sqlite", one_of("sqlite", "journal"), reloadable=False),
+	# Most dice a single /roll or /odds may use, and the number of dice in a term above which /roll summarises it
+	Setting("dice_max_count", int, 1000000, at_least(1)),
+	Setting("dice_detail_limit", int, 50, at_least(1)),
+	# Usernames allowed to use admin commands such as /profile and /reloadconfig
+	Setting("admins", parse_list, list),
+	Setting("plugins", parse_list, list, reloadable=False),
+]
+
+# Prefix of environment variables overriding settings (ex. TRB_WORKERS=8)
+ENV_PREFIX = "TRB_"
 
 class Config:
 	"""
 	Reads writes information to/from the program's configuration file.
 
+	Every setting described within SETTINGS is available as an attribute. Settings may be overridden through
+	environment variables named ENV_PREFIX followed by the setting's name in upper case.
+
 	...
 
 	Methods
 	-------
 	write_config(file_path)
 		Attempts to write out configuration info to the Configuration file.
+
+	reload()
+		Rereads the configuration file and environment, applying reloadable settings that changed.
+
+	subscribe(listener)
+		Registers a function called with (config, changed) after every reload.
 	"""
 
 	def __init__(self, file_path=None):
 		"""
 		Attempts to initally read existing data within the configuation file.
+		Without a file_path every setting is set to its default.
 
 		...
 
@@ -25,32 +118,91 @@ class Config:
 			Designated path to the configuration file.
 		"""
 
+		self.logger = logging.getLogger('bot_log')
+		self.file_path = file_path
+		self.lock = threading.Lock()
+		self.listeners = []
+
 		if not file_path:
+			for setting in SETTINGS:
+				setattr(self, setting.name, setting.get_default())
 			return
-		with open(file_path, 'r') as f:
+
+		for name, value in self.read().items():
+			setattr(self, name, value)
+
+	def read(self):
+		"""
+		Reads, parses and validates every setting from the configuration file and environment.
+		Returns a dict of setting names to values, raising an Exception if any setting is invalid.
+		"""
+
+		with open(self.file_path, 'r') as f:
 			config = f.read()
-			try:
-				self.token = re.search("token=\"(.+)\"", config).group(1)
-			except:
-				raise Exception("Config token not formatted correctly!")
 
-			try:
-				self.bot_dir = re.search("bot_dir=\"(.+)\"", config).group(1)
-			except:
-				self.bot_dir = os.path.abspath('')
+		raw = {}
+		for match in re.finditer("^(\\w+)=(?:\"(.*)\"|\\[(.*)\\])\\s*$", config, re.MULTILINE):
+			raw[match.group(1)] = match.group(2) if match.group(2) is not None else match.group(3)
 
-			try:
-				self.sleep_interval = int(re.search("sleep_interval=\"(.+)\"", config).group(1))
-			except:
-				self.sleep_interval = 2
+		values = {}
+		for setting in SETTINGS:
+			text = os.environ.get(ENV_PREFIX + setting.name.upper(), raw.get(setting.name))
+
+			if text is None or text == "":
+				if setting.default is None:
+					raise Exception("Config {} not formatted correctly!".format(setting.name))
+				values[setting.name] = setting.get_default()
+				continue
 
 			try:
-				self.plugins = []
-				p = re.search("plugins=\[(.+)\]", config).group(1).split(",")
-				for plugin in p:
-					self.plugins.append(plugin.strip())
-			except:
-				self.plugins = {}
+				value = setting.parse(text)
+			except ValueError:
+				raise Exception("Config {} has an invalid value \"{}\"!".format(setting.name, text))
+
+			error = setting.check(value) if setting.check else None
+			if error:
+				raise Exception("Config {} {}!".format(setting.name, error))
+			values[setting.name] = value
+
+		return values
+
+	def reload(self):
+		"""
+		Rereads the configuration file and environment, applying reloadable settings that changed and notifying listeners.
+		Returns a list of the names of settings that changed. Nothing is applied if any setting is invalid.
+		"""
+
+		with self.lock:
+			values = self.read()
+			changed = []
+
+			for setting in SETTINGS:
+				value = values[setting.name]
+
+				if value == getattr(self, setting.name):
+					continue
+				if setting.reloadable:
+					setattr(self, setting.name, value)
+					changed.append(setting.name)
+				else:
+					self.logger.warning("Config {} changed but requires a restart to take effect".format(setting.name))
+
+			self.logger.info("Reloaded config, changed settings: {}".format(changed))
+
+			for listener in list(self.listeners):
+				try:
+					listener(self, changed)
+				except Exception:
+					self.logger.exception("Unable to apply reloaded config")
+
+			return changed
+
+	def subscribe(self, listener):
+		"""
+		Registers a function called with (config, changed) after every reload, where changed lists the names of changed settings.
+		"""
+
+		self.listeners.append(listener)
 
 	def write_config(self, file_path):
 		"""
@@ -65,10 +217,13 @@ class Config:
 		"""
 
 		with open(file_path, 'w') as f:
-			f.write("token=\""+self.token+"\"\n")
-			f.write("bot_dir=\""+self.bot_dir+"\"\n")
-			f.write("sleep_interval=\""+str(self.sleep_interval)+"\"\n")
-			f.write("plugins=["+",".join(self.plugins)+"]\n")
+			for setting in SETTINGS:
+				value = getattr(self, setting.name)
+
+				if isinstance(value, list):
+					f.write(setting.name+"=["+",".join(value)+"]\n")
+				else:
+					f.write(setting.name+"=\""+str(value)+"\"\n")
 
 class ConfigWizard:
 	"""
@@ -95,3 +250,4 @@ class ConfigWizard:
 		self.conf.sleep_interval = int(input("How many seconds should be between fetches of new messages?\n"))
 		self.conf.plugins = input("What plugins would you like to use (seperate with ',')?\n").split(",")
 		self.conf.write_config(file_path)
+		self.conf.file_path = file_path
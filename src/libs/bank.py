@@ -1,5 +1,11 @@
+import bisect
 import json
 import os
+import sqlite3
+import threading
+import time
+
+from collections import deque
 
 """
 Created by Matthew Klawitter 12/11/2017
@@ -7,83 +13,484 @@ Last Updated: 9/3/2019
 Version: v1.2.2.2
 """
 
+# Accounts whose names start with this prefix hold pooled funds (such as betting pools) rather than
+# belonging to a user, and are left out of leaderboards
+POOL_PREFIX = "pool:"
+# Most recent postings of each account available through Bank.get_history, whichever the backend
+HISTORY_SIZE = 50
 
-class Bank:
-    def __init__(self):
-        self.dir = "bank.json"
+
+class SqliteLedger:
+    """
+    Ledger backend storing accounts as indexed rows of a SQLite database in WAL mode.
+    Every change to a balance is recorded as a posting within the same transaction as the balance update.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        # Transactions are managed explicitly with BEGIN IMMEDIATE / COMMIT
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS accounts ("
+                        "name TEXT PRIMARY KEY, "
+                        "balance INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS postings ("
+                        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                        "account TEXT NOT NULL, "
+                        "amount INTEGER NOT NULL, "
+                        "balance INTEGER NOT NULL, "
+                        "time REAL NOT NULL)")
+        # Pages through an account's history and ranks accounts without scanning every row
+        self.db.execute("CREATE INDEX IF NOT EXISTS postings_account ON postings (account, id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS accounts_balance ON accounts (balance)")
+
+    def is_empty(self):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM accounts LIMIT 1").fetchone() is None
+
+    def balance(self, name):
+        with self.lock:
+            row = self.db.execute("SELECT balance FROM accounts WHERE name = ?", (name,)).fetchone()
+            return row[0] if row else None
+
+    def create(self, name, balance=0):
+        with self.lock:
+            cursor = self.db.execute("INSERT OR IGNORE INTO accounts (name, balance) VALUES (?, ?)", (name, balance))
+            return cursor.rowcount == 1
+
+    def remove(self, name):
+        with self.lock:
+            cursor = self.db.execute("DELETE FROM accounts WHERE name = ?", (name,))
+            if cursor.rowcount == 0:
+                raise KeyError(name)
+
+    def import_accounts(self, accounts):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO accounts (name, balance) VALUES (?, ?)", accounts.items())
+                self.db.execute("COMMIT")
+            except:
+                self.db.execute("ROLLBACK")
+                raise
+
+    # Applies a list of (account, amount) postings in a single transaction.
+    # Nothing is applied if an account does not exist or any balance would become negative.
+    def apply(self, postings):
+        now = time.time()
+
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for name, amount in postings:
+                    cursor = self.db.execute("UPDATE accounts SET balance = balance + ? "
+                                             "WHERE name = ? AND balance + ? >= 0", (amount, name, amount))
+                    if cursor.rowcount == 0:
+                        self.db.execute("ROLLBACK")
+                        return False
+
+                    balance = self.db.execute("SELECT balance FROM accounts WHERE name = ?", (name,)).fetchone()[0]
+                    self.db.execute("INSERT INTO postings (account, amount, balance, time) VALUES (?, ?, ?, ?)",
+                                    (name, amount, balance, now))
+                self.db.execute("COMMIT")
+                return True
+            except:
+                self.db.execute("ROLLBACK")
+                raise
+
+    # Returns up to limit (amount, balance, time) postings of an account, newest first, skipping offset postings
+    def history(self, name, offset, limit):
+        with self.lock:
+            return self.db.execute("SELECT amount, balance, time FROM postings WHERE account = ? "
+                                   "ORDER BY id DESC LIMIT ? OFFSET ?", (name, limit, offset)).fetchall()
+
+    # Returns the count (name, balance) accounts with the highest balances
+    def top(self, count):
+        with self.lock:
+            return self.db.execute("SELECT name, balance FROM accounts WHERE name NOT LIKE ? "
+                                   "ORDER BY balance DESC, name LIMIT ?", (POOL_PREFIX + "%", count)).fetchall()
+
+    # Returns a sorted list of (name, balance) accounts whose names start with prefix
+    def find(self, prefix):
+        with self.lock:
+            # Every name starting with prefix sorts between prefix and prefix followed by the highest code point
+            return self.db.execute("SELECT name, balance FROM accounts WHERE name >= ? AND name < ? ORDER BY name",
+                                   (prefix, prefix + "\U0010ffff")).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class JournalLedger:
+    """
+    Ledger backend keeping balances in memory and persisting every change as a line appended to a journal.
+
+    Once compact_every entries have been appended the balances are written to a snapshot and the journal is
+    rotated into an archived segment (path.<seq>). Segments are covered by the snapshot, so only the latest
+    keep_segments are kept as a short audit trail and older ones are deleted. On startup the latest
+    snapshot is loaded and only the journal written since is replayed. A partially written final line left
+    by a crash, one without its newline, is discarded, while a corrupt line before it raises an exception.
+
+    Accounts are also kept within a list sorted by balance, updated on each posting, and the latest
+    history_size postings of each account are kept in memory (and within snapshots) for history queries.
+    """
+
+    def __init__(self, path, compact_every=10000, fsync=True, history_size=HISTORY_SIZE, keep_segments=1):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.compact_every = compact_every
+        self.keep_segments = keep_segments
+        self.fsync = fsync
+        self.history_size = history_size
+        # Guards appending to the journal and changing balances so snapshots are always consistent
+        self.lock = threading.RLock()
+        # Map of account names to locks, acquired in sorted order by apply() so transfers between
+        # unrelated accounts validate concurrently without deadlocking
+        self.account_locks = {}
+        self.account_locks_lock = threading.Lock()
         self.accounts = {}
-        self.load_accounts()
+        # Map of account names to deques of their latest (amount, balance, time) postings, oldest first
+        self.histories = {}
+        # List of (-balance, name) tuples in ascending order, so the richest accounts come first
+        self.ranking = []
+        self.seq = 0
+        self.entries = 0
 
-    def create_account(self, name):
-        self.load_accounts()
+        self.recover()
+        self.prune_segments()
+        self.ranking = sorted((-balance, name) for name, balance in self.accounts.items() if not name.startswith(POOL_PREFIX))
+        self.journal = open(self.path, "a")
 
-        if not self.account_exists(name):
-            self.accounts[name] = 0
-            self.save_accounts()
-            return True
-        return False
+    # Loads the latest snapshot then replays journal entries written after it
+    def recover(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            self.accounts = snapshot["accounts"]
+            self.seq = snapshot["seq"]
+            for name, history in snapshot.get("histories", {}).items():
+                self.histories[name] = deque((tuple(posting) for posting in history), self.history_size)
 
-    def account_exists(self, name):
-        self.load_accounts()
+        if not os.path.exists(self.path):
+            return
 
-        if name in self.accounts:
-            return True
-        return False
+        valid = 0
+        with open(self.path, "rb") as f:
+            for number, line in enumerate(f, 1):
+                # Entries are written with their newline in one write, so only a final line without one can have
+                # been torn by a crash, even if what was written happens to parse
+                if not line.endswith(b"\n"):
+                    print("Bank: Discarding a partially written journal entry in {}.".format(self.path))
+                    break
 
-    def remove_account(self, name):
-        self.load_accounts()
-        del self.accounts[name]
-        self.save_accounts()
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    raise Exception("Bank: Journal entry {} of {} is corrupt, refusing to discard the entries "
+                                    "after it".format(number, self.path))
 
-    def save_accounts(self):
+                valid += len(line)
+                if entry["seq"] > self.seq:
+                    self.replay(entry)
+                    self.seq = entry["seq"]
+                    self.entries += 1
+
+        # Drop a torn final line so the journal ends with a newline and new entries start on a line of their own
+        if valid < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+
+    def replay(self, entry):
+        op = entry["op"]
+
+        if op == "create":
+            self.accounts.setdefault(entry["account"], 0)
+        elif op == "remove":
+            self.accounts.pop(entry["account"], None)
+            self.histories.pop(entry["account"], None)
+        elif op == "import":
+            self.accounts.update(entry["accounts"])
+        elif op == "post":
+            for name, amount in entry["postings"]:
+                self.accounts[name] += amount
+                self.record(name, amount, self.accounts[name], entry["time"])
+
+    def record(self, name, amount, balance, time):
+        if name not in self.histories:
+            self.histories[name] = deque(maxlen=self.history_size)
+        self.histories[name].append((amount, balance, time))
+
+    # Moves an account within the ranking from its old balance (None if new) to its new balance (None if removed)
+    def rerank(self, name, old, new):
+        if name.startswith(POOL_PREFIX):
+            return
+        if old is not None:
+            del self.ranking[bisect.bisect_left(self.ranking, (-old, name))]
+        if new is not None:
+            bisect.insort(self.ranking, (-new, name))
+
+    def append(self, entry):
+        self.seq += 1
+        entry["seq"] = self.seq
+        entry["time"] = time.time()
+
+        self.journal.write(json.dumps(entry) + "\n")
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+
+        self.entries += 1
+
+    # Compacts once enough entries have been appended, called after the entry has been applied to the balances
+    def maybe_compact(self):
+        if self.entries >= self.compact_every:
+            self.compact()
+
+    # Writes the balances to a new snapshot, then archives the journal it covers
+    def compact(self):
+        with self.lock:
+            temp_path = self.snapshot_path + ".tmp"
+            with open(temp_path, "w") as f:
+                histories = {name: list(history) for name, history in self.histories.items()}
+                json.dump({"seq": self.seq, "accounts": self.accounts, "histories": histories}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            # The rename must reach the disk before the segments it replaces can be deleted
+            self.sync_directory()
+
+            self.journal.close()
+            os.replace(self.path, "{}.{}".format(self.path, self.seq))
+            self.journal = open(self.path, "a")
+            self.entries = 0
+            self.prune_segments()
+
+    # Deletes archived segments already covered by the snapshot, apart from the latest keep_segments
+    def prune_segments(self):
+        if not os.path.exists(self.snapshot_path):
+            return
+
+        directory, name = os.path.split(os.path.abspath(self.path))
+        segments = []
+        for file in os.listdir(directory):
+            suffix = file[len(name) + 1:]
+            if file.startswith(name + ".") and suffix.isdigit() and int(suffix) <= self.seq:
+                segments.append((int(suffix), file))
+
+        for seq, file in sorted(segments)[:max(len(segments) - self.keep_segments, 0)]:
+            os.remove(os.path.join(directory, file))
+
+    def sync_directory(self):
+        # Directories can only be opened for syncing on POSIX systems
+        if not self.fsync or not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
         try:
-            with open(self.dir, "w+") as f:
-                json.dump(self.accounts, f, sort_keys=True, indent=4)
-                f.seek(0)
-                f.close()
-        except FileNotFoundError:
-            print("Bank: Unable to find {}, creating a new file.").format(self.dir)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
-            # Ensure that the account file is created.
-            file = open(self.dir, "r+")
-            file.seek(0)
-            file.close()
+    def is_empty(self):
+        with self.lock:
+            return not self.accounts
 
-            self.save_accounts()
+    def balance(self, name):
+        return self.accounts.get(name)
 
-    def load_accounts(self):
+    def create(self, name, balance=0):
+        with self.lock:
+            if name in self.accounts:
+                return False
+            self.append({"op": "create", "account": name})
+            self.accounts[name] = 0
+            self.rerank(name, None, 0)
+            self.maybe_compact()
+            return True
+
+    def remove(self, name):
+        with self.get_account_lock(name), self.lock:
+            if name not in self.accounts:
+                raise KeyError(name)
+            self.append({"op": "remove", "account": name})
+            self.rerank(name, self.accounts.pop(name), None)
+            self.histories.pop(name, None)
+            self.maybe_compact()
+
+    def import_accounts(self, accounts):
+        with self.lock:
+            self.append({"op": "import", "accounts": accounts})
+            for name, balance in accounts.items():
+                self.rerank(name, self.accounts.get(name), balance)
+                self.accounts[name] = balance
+            self.maybe_compact()
+
+    def get_account_lock(self, name):
+        with self.account_locks_lock:
+            if name not in self.account_locks:
+                self.account_locks[name] = threading.Lock()
+            return self.account_locks[name]
+
+    # Applies a list of (account, amount) postings as a single journal entry.
+    # Nothing is applied if an account does not exist or any balance would become negative.
+    def apply(self, postings):
+        locks = [self.get_account_lock(name) for name in sorted(set(name for name, amount in postings))]
+
+        for lock in locks:
+            lock.acquire()
         try:
-            with open(self.dir, "r+") as f:
-                self.accounts = json.load(f)
-                f.seek(0)
-                f.close()
+            # Validate against the running balances so repeated accounts within postings are handled
+            balances = {}
+            for name, amount in postings:
+                if name not in balances:
+                    if name not in self.accounts:
+                        return False
+                    balances[name] = self.accounts[name]
+                balances[name] += amount
+                if balances[name] < 0:
+                    return False
+
+            with self.lock:
+                entry = {"op": "post", "postings": [[name, amount] for name, amount in postings]}
+                self.append(entry)
+
+                running = {}
+                for name, amount in postings:
+                    running[name] = running.get(name, self.accounts[name]) + amount
+                    self.record(name, amount, running[name], entry["time"])
+                for name, balance in balances.items():
+                    self.rerank(name, self.accounts[name], balance)
+                    self.accounts[name] = balance
+                self.maybe_compact()
             return True
-        except FileNotFoundError:
-            print("Bank: Accounts failed to load!")
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    # Returns up to limit (amount, balance, time) postings of an account, newest first, skipping offset postings.
+    # Only the latest history_size postings of each account are kept.
+    def history(self, name, offset, limit):
+        with self.lock:
+            history = self.histories.get(name, ())
+            end = max(len(history) - offset, 0)
+            return [history[i] for i in range(end - 1, max(end - limit, 0) - 1, -1)]
+
+    # Returns the count (name, balance) accounts with the highest balances
+    def top(self, count):
+        with self.lock:
+            return [(name, -balance) for balance, name in self.ranking[:count]]
+
+    # Returns a sorted list of (name, balance) accounts whose names start with prefix
+    def find(self, prefix):
+        with self.lock:
+            return sorted((name, balance) for name, balance in self.accounts.items() if name.startswith(prefix))
+
+    def close(self):
+        with self.lock:
+            self.journal.close()
+
+
+class Bank:
+    BACKENDS = {"sqlite": (SqliteLedger, "bank.db"), "journal": (JournalLedger, "bank.journal")}
+
+    def __init__(self, path=None, legacy_path="bank.json", backend="sqlite"):
+        ledger_class, default_path = Bank.BACKENDS[backend]
+        self.dir = path if path else default_path
+        self.ledger = ledger_class(self.dir)
+        self.migrate(legacy_path)
+
+    # Imports accounts from the JSON file used by earlier versions into an empty ledger.
+    # The JSON file is renamed afterwards so it is only ever imported once.
+    def migrate(self, legacy_path):
+        if not os.path.exists(legacy_path) or not self.ledger.is_empty():
             return False
+
+        try:
+            with open(legacy_path, "r") as f:
+                accounts = json.load(f)
         except ValueError:
-            print("Bank: Cannot load an empty file!")
+            print("Bank: Cannot migrate an empty or invalid file {}!".format(legacy_path))
             return False
 
+        self.ledger.import_accounts({name: int(balance) for name, balance in accounts.items()})
+        os.replace(legacy_path, legacy_path + ".migrated")
+        print("Bank: Migrated {} accounts from {}.".format(len(accounts), legacy_path))
+        return True
+
+    def create_account(self, name):
+        return self.ledger.create(name)
+
+    def account_exists(self, name):
+        return self.ledger.balance(name) is not None
+
+    def remove_account(self, name):
+        self.ledger.remove(name)
+
+    # Changes are committed as they are made, kept for compatibility with plugins calling it directly
+    def save_accounts(self):
+        pass
+
+    # Balances are read from the ledger on demand, kept for compatibility with plugins calling it directly
+    def load_accounts(self):
+        return True
+
     def get_balance(self, name):
-        self.load_accounts()
+        balance = self.ledger.balance(name)
 
-        return self.accounts[name]
+        if balance is None:
+            raise KeyError(name)
+        return balance
 
     def pay(self, name, amount):
-        self.load_accounts()
-
         if amount > 0:
-            self.accounts[name] += amount
-            self.save_accounts()
-            return True
+            if self.ledger.apply([(name, amount)]):
+                return True
+            raise KeyError(name)
         return False
 
     def charge(self, name, amount):
-        self.load_accounts()
-
-        if self.accounts[name] >= amount:
-            self.accounts[name] -= amount
-            self.save_accounts()
+        if self.ledger.apply([(name, -amount)]):
             return True
-        return False
\ No newline at end of file
+        if not self.account_exists(name):
+            raise KeyError(name)
+        return False
+
+    # Moves amount from one account to another atomically, returning False if either account
+    # does not exist or from_name cannot afford it
+    def transfer(self, from_name, to_name, amount):
+        if amount <= 0:
+            return False
+        return self.ledger.apply([(from_name, -amount), (to_name, amount)])
+
+    # Atomically applies a list of (account, amount) postings in a single commit, where a negative amount
+    # is a charge. Returns False and applies nothing if any account does not exist or would be overdrawn.
+    def apply(self, postings):
+        return self.ledger.apply(postings)
+
+    # Returns a page of (amount, balance, time) postings made to an account, newest first. Only the latest
+    # HISTORY_SIZE postings are paged through, which is all the journal backend keeps
+    def get_history(self, name, page=0, page_size=10):
+        offset = page * page_size
+        limit = min(page_size, HISTORY_SIZE - offset)
+        if limit <= 0:
+            return []
+        return self.ledger.history(name, offset, limit)
+
+    # Returns a list of the count (name, balance) accounts with the highest balances, richest first
+    def get_leaderboard(self, count=10):
+        return self.ledger.top(count)
+
+    # Returns the name of the account holding a chat's named pool
+    @staticmethod
+    def pool_account(chat_id, pool):
+        return "{}{}:{}".format(POOL_PREFIX, chat_id, pool)
+
+    # Returns a sorted list of (pool, balance) for every pool created within a chat
+    def get_pools(self, chat_id):
+        prefix = Bank.pool_account(chat_id, "")
+        return [(name[len(prefix):], balance) for name, balance in self.ledger.find(prefix)]
+
+    def close(self):
+        self.ledger.close()
@@ -0,0 +1,106 @@
+import logging
+import threading
+
+
+class BufferedWriter:
+    """
+    Collects records in memory and hands them to a write function in batches from a background thread.
+
+    A batch is written once batch_size records are buffered or flush_interval seconds have passed.
+    The buffer is bounded: when max_buffered records are waiting (for example if the disk stalls)
+    the appending thread writes the batch itself instead of letting memory grow. A batch that
+    fails to be written is put back in front of the buffer and retried by the next flush, and
+    records appended after close() raise an exception rather than being lost.
+
+    ...
+
+    Methods
+    -------
+    append(record)
+        Buffers a single record
+
+    flush()
+        Writes every buffered record immediately
+
+    close()
+        Flushes buffered records and stops the background thread
+    """
+
+    def __init__(self, write, batch_size=1000, flush_interval=5, max_buffered=100000):
+        """
+        Parameters
+        ----------
+        write: function
+            Called with a list of records to persist them, always from one thread at a time
+
+        batch_size: int
+            Number of buffered records that wakes the background thread early
+
+        flush_interval: float
+            Maximum number of seconds a record stays buffered
+
+        max_buffered: int
+            Number of buffered records at which append() writes the batch itself
+        """
+
+        self.logger = logging.getLogger('bot_log')
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.buffer = []
+        # Guards the buffer, held only long enough to append or swap it out
+        self.lock = threading.Lock()
+        # Serializes calls to write so batches stay in order
+        self.write_lock = threading.Lock()
+        self.closed = False
+
+        self._wake = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="buffered-writer", daemon=True)
+        self._flusher.start()
+
+    def append(self, record):
+        with self.lock:
+            if self.closed:
+                raise Exception("BufferedWriter: Cannot append a record after closing")
+            self.buffer.append(record)
+            buffered = len(self.buffer)
+
+        if buffered >= self.max_buffered:
+            self.flush()
+        elif buffered >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+
+            if batch:
+                try:
+                    self.write(batch)
+                except Exception:
+                    # Records appended meanwhile are newer, so the batch goes back in front of them
+                    with self.lock:
+                        self.buffer[:0] = batch
+                    raise
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self.closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception("BufferedWriter: Unable to write buffered records, retrying in {} seconds".format(
+                    self.flush_interval))
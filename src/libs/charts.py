@@ -0,0 +1,133 @@
+import io
+import math
+
+from PIL import Image, ImageDraw, ImageFont
+
+WIDTH = 640
+HEIGHT = 480
+# Space around the plotting area for the title, tick labels and axis labels
+MARGINS = (70, 40, 40, 60)
+
+
+def line_chart(dates, values, title, xlabel, ylabel, date_format="%Y-%m-%d", renderer="pillow"):
+    """
+    Renders a line chart of values over dates to JPEG bytes with the given renderer.
+
+    ...
+
+    Parameters
+    ----------
+    dates: list of datetime
+        Position of each point along the x axis, in ascending order
+
+    values: sequence of numbers
+        Height of each point
+
+    title, xlabel, ylabel: str
+        Text drawn above the chart and along each axis
+
+    date_format: str
+        strftime format of the x axis tick labels
+
+    renderer: str
+        Name of the renderer within RENDERERS
+    """
+
+    if renderer not in RENDERERS:
+        raise Exception("Unknown chart renderer {}!".format(renderer))
+    return RENDERERS[renderer](dates, values, title, xlabel, ylabel, date_format)
+
+
+def nice_ticks(low, high, count=5):
+    """
+    Returns evenly spaced tick values covering [low, high] with a step of 1, 2 or 5 times a power of ten.
+    """
+
+    if high <= low:
+        high = low + count
+    raw = (high - low) / count
+    power = 10 ** math.floor(math.log10(raw))
+    step = next(multiple * power for multiple in (1, 2, 5, 10) if multiple * power >= raw)
+
+    first = math.floor(low / step) * step
+    return [first + step * i for i in range(int(math.ceil((high - first) / step)) + 1)]
+
+
+def pillow_line_chart(dates, values, title, xlabel, ylabel, date_format):
+    """
+    Draws the chart directly onto a Pillow image, avoiding the cost of importing and laying out a matplotlib figure.
+    """
+
+    left, top, right, bottom = MARGINS
+    image = Image.new("RGB", (WIDTH, HEIGHT), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+
+    values = [int(value) for value in values]
+    times = [date.timestamp() for date in dates]
+    ticks = nice_ticks(min(0, min(values)), max(values))
+    x_low, x_high = times[0], times[-1] if times[-1] > times[0] else times[0] + 1
+    y_low, y_high = ticks[0], ticks[-1]
+
+    def x_of(t):
+        return left + (t - x_low) / (x_high - x_low) * (WIDTH - left - right)
+
+    def y_of(value):
+        return HEIGHT - bottom - (value - y_low) / (y_high - y_low) * (HEIGHT - top - bottom)
+
+    draw.text((WIDTH / 2, top / 2), title, fill="black", font=font, anchor="mm")
+    draw.text((WIDTH / 2, HEIGHT - 15), xlabel, fill="black", font=font, anchor="mm")
+    draw.text((15, HEIGHT / 2), ylabel, fill="black", font=font, anchor="lm")
+
+    for tick in ticks:
+        y = y_of(tick)
+        draw.line((left, y, WIDTH - right, y), fill=(225, 225, 225))
+        draw.text((left - 5, y), str(tick), fill="black", font=font, anchor="rm")
+
+    labels = min(len(dates), 6)
+    for i in range(labels):
+        date = dates[round(i * (len(dates) - 1) / max(labels - 1, 1))]
+        x = x_of(date.timestamp())
+        draw.line((x, HEIGHT - bottom, x, HEIGHT - bottom + 4), fill="black")
+        draw.text((x, HEIGHT - bottom + 8), date.strftime(date_format), fill="black", font=font, anchor="mt")
+
+    draw.rectangle((left, top, WIDTH - right, HEIGHT - bottom), outline="black")
+
+    points = [(x_of(t), y_of(value)) for t, value in zip(times, values)]
+    if len(points) > 1:
+        draw.line(points, fill="red", width=2)
+    for x, y in points:
+        draw.ellipse((x - 3, y - 3, x + 3, y + 3), fill="red")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def matplotlib_line_chart(dates, values, title, xlabel, ylabel, date_format):
+    """
+    Draws the chart with matplotlib, which is only imported the first time it is used.
+    """
+
+    import matplotlib.dates
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure()
+    try:
+        ax1 = fig.add_subplot(111)
+        ax1.set_title(title)
+        ax1.set_xlabel(xlabel)
+        ax1.set_ylabel(ylabel)
+        ax1.plot(dates, values, 'ro-')
+        ax1.xaxis.set_major_formatter(matplotlib.dates.DateFormatter(date_format))
+        fig.autofmt_xdate()
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="jpg")
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+
+# Renderers selectable by line_chart(), by name
+RENDERERS = {"pillow": pillow_line_chart, "matplotlib": matplotlib_line_chart}
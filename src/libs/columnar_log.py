@@ -0,0 +1,152 @@
+import os
+import threading
+
+import numpy as np
+
+
+class ColumnarLog:
+    """
+    Append-only message log stored column by column in fixed width binary files, read back through memory mapping.
+
+    Each column (date, user, length, chat) lives in its own <name>.bin file. Usernames are dictionary encoded:
+    the user column stores an index into users.txt, which holds one username per line. Rows are appended in
+    arrival order, so the date column is sorted and time ranges can be found with a binary search.
+
+    ...
+
+    Methods
+    -------
+    append(records)
+        Appends a list of (date, username, length, chat) records
+
+    columns()
+        Returns a dict of column names to read only memory mapped NumPy arrays
+
+    range(start, end)
+        Returns the columns sliced to rows with start <= date < end, without copying them
+
+    usernames()
+        Returns a NumPy array of usernames, indexable by the user column
+
+    import_csv(csv_path)
+        Appends every row of a log.csv file written by earlier versions of the stats plugin
+    """
+
+    COLUMNS = (("date", "<i8"), ("user", "<i4"), ("length", "<i4"), ("chat", "<i8"))
+
+    def __init__(self, directory):
+        self.dir = directory
+        if not os.path.exists(self.dir):
+            os.makedirs(self.dir)
+
+        self.lock = threading.Lock()
+        self.users_path = os.path.join(self.dir, "users.txt")
+        self.names = []
+        self.ids = {}
+
+        if os.path.exists(self.users_path):
+            with open(self.users_path, "r", encoding="utf-8") as f:
+                self.names = f.read().splitlines()
+            self.ids = {name: i for i, name in enumerate(self.names)}
+
+        self.rows = self.repair()
+
+    def path(self, column):
+        return os.path.join(self.dir, column + ".bin")
+
+    # Truncates every column to the number of complete rows, dropping a row half written by a crash
+    def repair(self):
+        rows = min(self.column_rows(name, dtype) for name, dtype in ColumnarLog.COLUMNS)
+
+        for name, dtype in ColumnarLog.COLUMNS:
+            if self.column_rows(name, dtype) != rows or os.path.getsize(self.path(name)) % np.dtype(dtype).itemsize:
+                with open(self.path(name), "r+b") as f:
+                    f.truncate(rows * np.dtype(dtype).itemsize)
+        return rows
+
+    def column_rows(self, name, dtype):
+        if not os.path.exists(self.path(name)):
+            open(self.path(name), "wb").close()
+        return os.path.getsize(self.path(name)) // np.dtype(dtype).itemsize
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, records):
+        if not records:
+            return
+
+        with self.lock:
+            new_names = []
+            user_ids = []
+            for date, user, length, chat in records:
+                if user not in self.ids:
+                    self.ids[user] = len(self.names)
+                    self.names.append(user)
+                    new_names.append(user)
+                user_ids.append(self.ids[user])
+
+            values = {
+                "date": [record[0] for record in records],
+                "user": user_ids,
+                "length": [record[2] for record in records],
+                "chat": [record[3] for record in records],
+            }
+            users_size = os.path.getsize(self.users_path) if os.path.exists(self.users_path) else 0
+
+            try:
+                # Usernames are written before any row refers to them
+                if new_names:
+                    with open(self.users_path, "a", encoding="utf-8") as f:
+                        f.write("".join(name.replace("\n", " ") + "\n" for name in new_names))
+
+                for name, dtype in ColumnarLog.COLUMNS:
+                    with open(self.path(name), "ab") as f:
+                        np.asarray(values[name], dtype=dtype).tofile(f)
+            except Exception:
+                # Everything written is undone so the same records can be appended again without duplicating rows
+                self.rollback(users_size, new_names)
+                raise
+
+            self.rows += len(records)
+
+    def rollback(self, users_size, new_names):
+        for name in new_names:
+            del self.ids[name]
+        del self.names[len(self.names) - len(new_names):]
+
+        if os.path.exists(self.users_path):
+            with open(self.users_path, "r+b") as f:
+                f.truncate(users_size)
+        for name, dtype in ColumnarLog.COLUMNS:
+            with open(self.path(name), "r+b") as f:
+                f.truncate(self.rows * np.dtype(dtype).itemsize)
+
+    def columns(self):
+        with self.lock:
+            rows = self.rows
+
+        columns = {}
+        for name, dtype in ColumnarLog.COLUMNS:
+            if rows:
+                columns[name] = np.memmap(self.path(name), dtype=dtype, mode="r", shape=(rows,))
+            else:
+                columns[name] = np.empty(0, dtype=dtype)
+        return columns
+
+    def range(self, start, end):
+        columns = self.columns()
+        first, last = np.searchsorted(columns["date"], [start, end])
+        return {name: column[first:last] for name, column in columns.items()}
+
+    def usernames(self):
+        with self.lock:
+            return np.array(self.names, dtype=object)
+
+    def import_csv(self, csv_path):
+        data = np.genfromtxt(csv_path, delimiter=',', dtype=[('date', '<i8'), ('name', 'U64'), ('length', '<i8')],
+                             encoding='utf-8', invalid_raise=False)
+        data = np.atleast_1d(data)
+        # Chats were not recorded in log.csv
+        self.append([(date, name, length, 0) for date, name, length in data.tolist()])
+        return len(data)
@@ -0,0 +1,706 @@
+import functools
+import math
+import random
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Most times a single exploding die may be rerolled
+MAX_EXPLOSIONS = 100
+# Most sides a die may have, keeping every total well within NumPy's 64 bit integers
+MAX_SIDES = 1000000
+# Dice rolled at once with NumPy rather than one at a time
+VECTOR_THRESHOLD = 100
+# Largest die whose faces are counted when a roll is summarised
+HISTOGRAM_SIDES = 20
+# Most outcomes a distribution may have before odds are refused
+MAX_OUTCOMES = 10000000
+# Most dice a term keeping or dropping dice may have when computing odds
+MAX_KEEP_DICE = 200
+# Most steps (faces times dice times kept dice times possible kept sums) spent on the odds of keeping or dropping dice
+MAX_KEEP_WORK = 1000000000
+# Odds follow exploding dice until the chance of another explosion falls below this
+EXPLOSION_CUTOFF = 1e-15
+# Outcomes above which distributions are combined through FFTs rather than direct convolution
+FFT_THRESHOLD = 4096
+# Most outcomes (8 bytes each) held by cached distributions altogether, and by any single cached distribution
+CACHE_OUTCOMES = 2000000
+MAX_CACHED_OUTCOMES = 200000
+
+
+class Distribution:
+    """
+    Exact probability of every total an expression can roll, as probs[i] being the chance of rolling offset + i.
+
+    ...
+
+    Methods
+    -------
+    add(other, sign)
+        Returns the distribution of this total plus (or minus, with sign -1) the other's
+
+    mean()
+        Returns the expected total
+
+    percentile(fraction)
+        Returns the lowest total rolled at least that fraction of the time or less
+
+    at_least(target)
+        Returns the chance of rolling target or more
+
+    lowest(), highest()
+        Return the lowest and highest possible totals
+    """
+
+    def __init__(self, offset, probs):
+        self.offset = offset
+        self.probs = np.asarray(probs, dtype=np.float64)
+
+    def add(self, other, sign=1):
+        probs, offset = other.probs, other.offset
+        if sign < 0:
+            probs, offset = probs[::-1], -(other.offset + len(other.probs) - 1)
+
+        if len(self.probs) + len(probs) - 1 > MAX_OUTCOMES:
+            raise ValueError("Odds are limited to {} possible totals".format(MAX_OUTCOMES))
+        return Distribution(self.offset + offset, convolve(self.probs, probs))
+
+    def mean(self):
+        return self.offset + float(np.dot(np.arange(len(self.probs)), self.probs))
+
+    def percentile(self, fraction):
+        cumulative = np.cumsum(self.probs)
+        # Tolerates rounding error in the sum of the probabilities
+        return self.offset + int(min(np.searchsorted(cumulative, fraction - 1e-12), len(self.probs) - 1))
+
+    def at_least(self, target):
+        index = target - self.offset
+        if index <= 0:
+            return 1.0
+        return min(float(self.probs[index:].sum()), 1.0)
+
+    # Every distribution is built with its lowest and highest totals at either end of probs
+    def lowest(self):
+        return self.offset
+
+    def highest(self):
+        return self.offset + len(self.probs) - 1
+
+
+def convolve(a, b):
+    """
+    Returns the convolution of two probability arrays, through FFTs when both are large.
+    """
+
+    size = len(a) + len(b) - 1
+    if min(len(a), len(b)) <= 64 or size <= FFT_THRESHOLD:
+        return np.convolve(a, b)
+
+    n = 1 << (size - 1).bit_length()
+    result = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)[:size]
+    # Rounding error leaves tiny negative values where the probability is zero
+    return np.clip(result, 0, None)
+
+
+def power(probs, count):
+    """
+    Returns the distribution of the sum of count independent values each distributed as probs.
+    """
+
+    size = count * (len(probs) - 1) + 1
+    if size > MAX_OUTCOMES:
+        raise ValueError("Odds are limited to {} possible totals".format(MAX_OUTCOMES))
+
+    if count == 1:
+        return probs
+    if size > FFT_THRESHOLD:
+        # Raising the transform to a power convolves count copies at once
+        n = 1 << (size - 1).bit_length()
+        result = np.clip(np.fft.irfft(np.fft.rfft(probs, n) ** count, n)[:size], 0, None)
+        return result / result.sum()
+
+    # Exponentiation by squaring
+    result = np.ones(1)
+    while count:
+        if count & 1:
+            result = np.convolve(result, probs)
+        count >>= 1
+        if count:
+            probs = np.convolve(probs, probs)
+    return result
+
+
+def binomial(n, p):
+    """
+    Returns an array of the chance of exactly c successes out of n tries for every c from 0 to n.
+    """
+
+    if p >= 1:
+        result = np.zeros(n + 1)
+        result[n] = 1
+        return result
+    return np.array([math.comb(n, c) * p ** c * (1 - p) ** (n - c) for c in range(n + 1)])
+
+
+class Constant:
+    """
+    A whole number within a dice expression.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return str(self.value)
+
+    def dice_count(self):
+        return 0
+
+    def evaluate(self, stats, rng, detail_limit):
+        return self.value, str(self.value)
+
+    def stat_names(self):
+        return set()
+
+    def distribution(self, stats):
+        return Distribution(self.value, [1.0])
+
+
+class Stat:
+    """
+    Reference to a character's stat, which adds that stat's modifier ((stat - 10) / 2, rounded towards zero).
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+    def modifier(self, stats):
+        if self.name not in stats:
+            raise ValueError("Unknown stat {}".format(self.name))
+        return int((stats[self.name] - 10) / 2)
+
+    def dice_count(self):
+        return 0
+
+    def evaluate(self, stats, rng, detail_limit):
+        modifier = self.modifier(stats)
+        return modifier, "{} ({})".format(self.name, modifier)
+
+    def stat_names(self):
+        return {self.name}
+
+    def distribution(self, stats):
+        return Distribution(self.modifier(stats), [1.0])
+
+
+class Dice:
+    """
+    Rolls count dice with the given number of sides (NdM).
+
+    ...
+
+    Properties
+    ----------
+    self.keep: tuple or None
+        ("h", n) keeps the n highest dice and ("l", n) the n lowest, None keeps every die
+
+    self.explode: bool
+        Whether a die showing its highest side is rolled again and added
+    """
+
+    def __init__(self, count, sides, keep=None, explode=False):
+        self.count = count
+        self.sides = sides
+        self.keep = keep
+        self.explode = explode
+
+    def __str__(self):
+        text = "{}d{}".format(self.count, self.sides)
+        if self.explode:
+            text += "!"
+        if self.keep:
+            text += "k" + self.keep[0] + str(self.keep[1])
+        return text
+
+    def kept(self, count):
+        """
+        Returns the number of dice kept out of count, and whether the highest (True) or lowest are kept.
+        """
+
+        if not self.keep:
+            return count, True
+        return min(self.keep[1], count), self.keep[0] == "h"
+
+    def dice_count(self):
+        return self.count
+
+    def roll_die(self, rng):
+        rolls = [rng.randint(1, self.sides)]
+        while self.explode and self.sides > 1 and rolls[-1] == self.sides and len(rolls) <= MAX_EXPLOSIONS:
+            rolls.append(rng.randint(1, self.sides))
+        return rolls
+
+    def roll_many(self, rng):
+        """
+        Rolls every die at once with NumPy, returning an array of each die's total including explosions.
+        """
+
+        # Seeded from rng so a seeded rng still gives repeatable rolls
+        generator = np.random.default_rng(rng.getrandbits(64))
+        totals = generator.integers(1, self.sides + 1, size=self.count, dtype=np.int64)
+
+        exploding = np.flatnonzero(totals == self.sides) if self.explode and self.sides > 1 else []
+        for _ in range(MAX_EXPLOSIONS):
+            if not len(exploding):
+                break
+            rolls = generator.integers(1, self.sides + 1, size=len(exploding), dtype=np.int64)
+            totals[exploding] += rolls
+            exploding = exploding[rolls == self.sides]
+        return totals
+
+    def evaluate(self, stats, rng, detail_limit):
+        if self.count > VECTOR_THRESHOLD:
+            return self.evaluate_many(rng, detail_limit)
+
+        dice = [self.roll_die(rng) for _ in range(self.count)]
+        totals = [sum(rolls) for rolls in dice]
+
+        kept, highest = self.kept(self.count)
+        order = sorted(range(self.count), key=lambda i: totals[i], reverse=highest)
+        keep = set(order[:kept])
+        total = sum(totals[i] for i in keep)
+
+        if self.count > detail_limit:
+            return total, self.summary(np.array([totals[i] for i in keep], dtype=np.int64), total)
+
+        shown = []
+        for i, rolls in enumerate(dice):
+            text = "+".join(str(roll) for roll in rolls)
+            shown.append(text if i in keep else "~" + text)
+        return total, "{} ({}) = {}".format(self, ", ".join(shown), total)
+
+    def evaluate_many(self, rng, detail_limit):
+        totals = self.roll_many(rng)
+
+        kept, highest = self.kept(self.count)
+        # Partitioning finds the kept dice without sorting every die
+        order = np.argpartition(-totals if highest else totals, kept - 1)[:kept] if kept else np.empty(0, dtype=np.int64)
+        total = int(totals[order].sum())
+
+        if self.count > detail_limit:
+            return total, self.summary(totals[order], total)
+
+        keep = np.zeros(self.count, dtype=bool)
+        keep[order] = True
+        shown = [str(value) if is_kept else "~" + str(value) for value, is_kept in zip(totals.tolist(), keep.tolist())]
+        return total, "{} ({}) = {}".format(self, ", ".join(shown), total)
+
+    def stat_names(self):
+        return set()
+
+    def die_distribution(self):
+        """
+        Returns the distribution of a single die. Exploding dice are followed until another explosion is less
+        likely than EXPLOSION_CUTOFF, the remaining chance being given to the last total followed.
+        """
+
+        if not self.explode or self.sides == 1:
+            return Distribution(1, np.full(self.sides, 1 / self.sides))
+
+        depth = self.explosion_depth()
+        # A total of k * sides + r (r < sides) means k explosions followed by r
+        probs = np.zeros((depth + 1) * self.sides)
+        for k in range(depth + 1):
+            probs[k * self.sides:(k + 1) * self.sides - 1] = self.sides ** -(k + 1.0)
+        probs[-1] = self.sides ** -(depth + 1.0)
+        return Distribution(1, probs)
+
+    def explosion_depth(self):
+        return min(MAX_EXPLOSIONS, math.ceil(math.log(EXPLOSION_CUTOFF) / math.log(1 / self.sides)))
+
+    def die_size(self):
+        """
+        Returns the number of totals a single die's distribution holds, without building it.
+        """
+
+        if not self.explode or self.sides == 1:
+            return self.sides
+        return (self.explosion_depth() + 1) * self.sides
+
+    def distribution(self, stats):
+        kept, highest = self.kept(self.count)
+        if kept == 0:
+            return Distribution(0, [1.0])
+
+        # Sizes are checked before any array is built, as a single large die is enough to exhaust memory
+        size = self.die_size()
+        if kept == self.count:
+            if self.count * (size - 1) + 1 > MAX_OUTCOMES:
+                raise ValueError("Odds are limited to {} possible totals".format(MAX_OUTCOMES))
+            die = self.die_distribution()
+            return Distribution(self.count * die.offset, power(die.probs, self.count))
+
+        if self.count > MAX_KEEP_DICE:
+            raise ValueError("Odds of keeping or dropping dice are limited to {} dice".format(MAX_KEEP_DICE))
+        # Dice totals start at 1, so the highest face is size and the kept sums run from 0 to kept * size
+        if (kept + 1) * (kept * size + 1) > MAX_OUTCOMES:
+            raise ValueError("Odds are limited to {} possible totals".format(MAX_OUTCOMES))
+        if size * self.count * kept * (kept * size + 1) > MAX_KEEP_WORK:
+            raise ValueError("Odds of keeping or dropping dice from {} take too long to compute".format(self))
+        return self.keep_distribution(self.die_distribution(), kept, highest)
+
+    def keep_distribution(self, die, kept, highest):
+        """
+        Returns the distribution of the sum of the kept dice.
+
+        Faces are visited from the first kept (highest or lowest) onwards. With j dice already showing earlier
+        faces, the number of the other count - j dice showing the current face is binomial, with the chance of
+        that face among the faces not yet visited. Only sums of up to kept dice are tracked, once kept dice
+        are assigned the remaining dice no longer matter.
+        """
+
+        faces = [(die.offset + i, p) for i, p in enumerate(die.probs.tolist()) if p > 0]
+        if highest:
+            faces.reverse()
+        # Chance of the current face or any face after it
+        remaining = np.cumsum([p for face, p in faces][::-1])[::-1].tolist()
+
+        size = kept * max(face for face, p in faces) + 1
+        # Row j holds the chances of each kept sum with j dice assigned, row kept once every kept die is
+        states = np.zeros((kept + 1, size))
+        states[0, 0] = 1
+
+        for (face, p), rest in zip(faces, remaining):
+            new = np.zeros_like(states)
+            new[kept] = states[kept]
+
+            for assigned in range(kept):
+                row = states[assigned]
+                if not row.any():
+                    continue
+
+                for count, chance in enumerate(binomial(self.count - assigned, min(p / rest, 1.0)).tolist()):
+                    if chance == 0:
+                        continue
+                    shift = face * min(count, kept - assigned)
+                    new[min(assigned + count, kept), shift:] += chance * row[:size - shift]
+            states = new
+
+        # Sums below kept times the lowest face are impossible
+        first = int(np.flatnonzero(states[kept])[0])
+        return Distribution(first, states[kept][first:])
+
+    def summary(self, kept, total):
+        """
+        Describes a roll of too many dice to list by the number of dice kept, their mean and range, and how
+        many landed on each face of small dice.
+        """
+
+        if not len(kept):
+            return "{} (no dice kept) = {}".format(self, total)
+
+        text = "{} ({} dice kept, mean {:.2f}, lowest {}, highest {}".format(
+            self, len(kept), kept.mean(), int(kept.min()), int(kept.max()))
+        if self.sides <= HISTOGRAM_SIDES and not self.explode:
+            faces = np.bincount(kept, minlength=self.sides + 1)[1:]
+            text += "; " + ", ".join("{}: {}".format(face, count) for face, count in enumerate(faces.tolist(), 1))
+        return text + ") = {}".format(total)
+
+
+class Sum:
+    """
+    Adds or subtracts a list of terms, each a (sign, node) tuple where sign is 1 or -1.
+    """
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    def __str__(self):
+        text = ""
+        for sign, node in self.terms:
+            node = "(" + str(node) + ")" if isinstance(node, Sum) else str(node)
+            if not text:
+                text = node if sign > 0 else "-" + node
+            else:
+                text += (" + " if sign > 0 else " - ") + node
+        return text
+
+    def dice_count(self):
+        return sum(node.dice_count() for sign, node in self.terms)
+
+    def stat_names(self):
+        return set().union(*(node.stat_names() for sign, node in self.terms))
+
+    def distribution(self, stats):
+        result = Distribution(0, [1.0])
+        for sign, node in self.terms:
+            result = result.add(node.distribution(stats), sign)
+        return result
+
+    def lines(self, stats, rng, detail_limit):
+        """
+        Rolls every term, returning the total and one line describing each term.
+        """
+
+        total = 0
+        lines = []
+        for sign, node in self.terms:
+            value, text = node.evaluate(stats, rng, detail_limit)
+            total += sign * value
+            lines.append(("+ " if sign > 0 else "- ") + text if lines or sign < 0 else text)
+        return total, lines
+
+    def evaluate(self, stats, rng, detail_limit):
+        total, lines = self.lines(stats, rng, detail_limit)
+        return total, "({}) = {}".format(" ".join(lines), total)
+
+
+class Parser:
+    """
+    Recursive descent parser for dice expressions.
+
+    expression := term (("+" | "-") term)*
+    term       := "-"? atom
+    atom       := number | dice | stat | "(" expression ")"
+    dice       := number? ("d" | "D") (number | "%") modifier*
+    modifier   := "!" | ("kh" | "kl" | "k" | "dh" | "dl") number
+    stat       := letter (letter | digit | "_")*
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def parse(self):
+        node = self.expression()
+        self.skip()
+        if self.pos != len(self.text):
+            raise ValueError("Unexpected '{}'".format(self.text[self.pos:]))
+        return node
+
+    def skip(self):
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+
+    def peek(self, length=1):
+        self.skip()
+        return self.text[self.pos:self.pos + length].lower()
+
+    def expression(self):
+        terms = [self.term(1)]
+        while self.peek() in ("+", "-"):
+            sign = 1 if self.peek() == "+" else -1
+            self.pos += 1
+            terms.append(self.term(sign))
+        return terms[0][1] if len(terms) == 1 and terms[0][0] > 0 else Sum(terms)
+
+    def term(self, sign):
+        if self.peek() == "-":
+            self.pos += 1
+            sign = -sign
+        return sign, self.atom()
+
+    def atom(self):
+        char = self.peek()
+        if char == "(":
+            self.pos += 1
+            node = self.expression()
+            if self.peek() != ")":
+                raise ValueError("Missing ')'")
+            self.pos += 1
+            return node
+        if char.isdigit():
+            count = self.number()
+            if self.is_dice():
+                return self.dice(count)
+            return Constant(count)
+        if self.is_dice():
+            return self.dice(1)
+        if char.isalpha() or char == "_":
+            start = self.pos
+            while self.pos < len(self.text) and (self.text[self.pos].isalnum() or self.text[self.pos] == "_"):
+                self.pos += 1
+            return Stat(self.text[start:self.pos])
+        raise ValueError("Expected a number, dice or stat" + (" at '{}'".format(self.text[self.pos:]) if char else ""))
+
+    def number(self):
+        self.skip()
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos].isdigit():
+            self.pos += 1
+        if start == self.pos:
+            raise ValueError("Expected a number" + (" at '{}'".format(self.text[start:]) if start < len(self.text) else ""))
+        return int(self.text[start:self.pos])
+
+    def is_dice(self):
+        # A "d" followed by a number or "%", so stats such as dex are not mistaken for dice
+        return self.peek() == "d" and (self.text[self.pos + 1:self.pos + 2].isdigit() or self.text[self.pos + 1:self.pos + 2] == "%")
+
+    def dice(self, count):
+        self.pos += 1
+        if self.text[self.pos] == "%":
+            self.pos += 1
+            sides = 100
+        else:
+            sides = self.number()
+        if count < 1 or sides < 1:
+            raise ValueError("Dice must have at least one die and one side")
+        if sides > MAX_SIDES:
+            raise ValueError("Dice are limited to {} sides".format(MAX_SIDES))
+
+        keep = None
+        explode = False
+        while True:
+            if self.peek() == "!":
+                self.pos += 1
+                explode = True
+            elif self.peek(2) in ("kh", "kl", "dh", "dl"):
+                kind = self.peek(2)
+                self.pos += 2
+                amount = self.number()
+                keep = self.keep(kind, amount, count)
+            elif self.peek() == "k" and self.text[self.pos + 1:self.pos + 2].isdigit():
+                self.pos += 1
+                keep = ("h", min(self.number(), count))
+            else:
+                return Dice(count, sides, keep, explode)
+
+    @staticmethod
+    def keep(kind, amount, count):
+        amount = min(amount, count)
+        if kind[0] == "k":
+            return kind[1], amount
+        # Dropping the n highest keeps the count - n lowest, and the other way around
+        return "l" if kind[1] == "h" else "h", count - amount
+
+
+@functools.lru_cache(maxsize=1024)
+def parse(expression):
+    """
+    Parses a dice expression into a tree of Constant, Stat, Dice and Sum nodes, raising ValueError if it is invalid.
+    Trees are cached by expression, so rolling the same expression again skips parsing.
+    """
+
+    return Parser(expression).parse()
+
+
+def roll(expression, stats=None, rng=random, max_dice=None, detail_limit=50):
+    """
+    Rolls a dice expression, returning the total and a list of lines describing each top level term.
+    Raises ValueError if the expression is invalid or rolls more than max_dice dice.
+
+    ...
+
+    Parameters
+    ----------
+    expression: str
+        The dice expression (ex. 4d6kh3 + 2, 1d20 + dex)
+
+    stats: dict, optional
+        Map of stat names to values used by stats within the expression
+
+    rng: random.Random, optional
+        Source of random numbers
+
+    max_dice: int, optional
+        Most dice the expression may roll in total, not counting explosions
+
+    detail_limit: int
+        Terms rolling more dice than this are summarised rather than listing every die
+    """
+
+    node = parse(expression)
+    if not isinstance(node, Sum):
+        node = Sum([(1, node)])
+    if max_dice is not None and node.dice_count() > max_dice:
+        raise ValueError("Rolls are limited to {} dice".format(max_dice))
+    return node.lines(stats or {}, rng, detail_limit)
+
+
+class DistributionCache:
+    """
+    Least recently used cache of distributions bounded by their total number of outcomes rather than their count,
+    as a single distribution may hold millions. Distributions larger than max_size are not cached.
+    """
+
+    def __init__(self, capacity=CACHE_OUTCOMES, max_size=MAX_CACHED_OUTCOMES):
+        self.capacity = capacity
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            distribution = self.entries.get(key)
+            if distribution is not None:
+                self.entries.move_to_end(key)
+            return distribution
+
+    def set(self, key, distribution):
+        size = len(distribution.probs)
+        if size > self.max_size:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = distribution
+            self.size += size
+            while self.size > self.capacity:
+                key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.probs)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+distributions = DistributionCache()
+
+
+def cached_distribution(expression, stats):
+    key = (expression, stats)
+    distribution = distributions.get(key)
+    if distribution is None:
+        distribution = parse(expression).distribution(dict(stats))
+        # Shared by every caller asking for the same odds
+        distribution.probs.flags.writeable = False
+        distributions.set(key, distribution)
+    return distribution
+
+
+def odds(expression, stats=None, max_dice=None):
+    """
+    Returns the exact Distribution of a dice expression's total, raising ValueError if the expression is invalid,
+    uses more than max_dice dice or has too many possible totals.
+    Distributions of up to MAX_CACHED_OUTCOMES totals are cached by expression and the values of the stats it uses.
+
+    ...
+
+    Parameters
+    ----------
+    expression: str
+        The dice expression (ex. 4d6kh3 + 2, 1d20 + dex)
+
+    stats: dict, optional
+        Map of stat names to values used by stats within the expression
+
+    max_dice: int, optional
+        Most dice the expression may roll in total
+    """
+
+    node = parse(expression)
+    if max_dice is not None and node.dice_count() > max_dice:
+        raise ValueError("Odds are limited to {} dice".format(max_dice))
+
+    stats = stats or {}
+    for name in node.stat_names():
+        if name not in stats:
+            raise ValueError("Unknown stat {}".format(name))
+    return cached_distribution(expression, tuple(sorted((name, stats[name]) for name in node.stat_names())))
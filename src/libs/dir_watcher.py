@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+
+
+class DirWatcher:
+    """
+    Polls a directory from a background thread and reports files that were added, changed or removed.
+
+    A file counts as changed when its size or modification time differs from the previous scan, so only the
+    affected files are reread. Files are reported by name without the suffix, matching how plugins name their
+    entries after their .txt files.
+
+    ...
+
+    Methods
+    -------
+    start()
+        Starts scanning in the background
+
+    scan()
+        Compares the directory against the previous scan, calling on_change and on_remove for every difference
+
+    close()
+        Stops the background thread
+    """
+
+    def __init__(self, directory, on_change, on_remove, suffix=".txt", interval=2):
+        """
+        Parameters
+        ----------
+        directory: str
+            Path to the directory to watch
+
+        on_change: function
+            Called with (name, path) for every file added or changed
+
+        on_remove: function
+            Called with name for every file removed
+
+        suffix: str
+            Only files ending with suffix are watched
+
+        interval: float
+            Seconds between scans
+        """
+
+        self.logger = logging.getLogger('bot_log')
+        self.dir = directory
+        self.on_change = on_change
+        self.on_remove = on_remove
+        self.suffix = suffix
+        self.interval = interval
+        # Map of file names to (size, modification time) as of the previous scan
+        self.files = {}
+        # Held during a scan so scans never overlap
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self._wake = threading.Event()
+        self._poller = threading.Thread(target=self._poll_loop, name="dir-watcher", daemon=True)
+
+    def start(self):
+        """
+        Starts scanning in the background. Call scan() first to load the directory's current contents.
+        """
+
+        self._poller.start()
+
+    def scan(self):
+        with self.lock:
+            found = {}
+            with os.scandir(self.dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(self.suffix) and entry.is_file():
+                        stat = entry.stat()
+                        found[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+            for file, signature in found.items():
+                if self.files.get(file) != signature:
+                    self._notify(self.on_change, self.name(file), os.path.join(self.dir, file))
+            for file in self.files.keys() - found.keys():
+                self._notify(self.on_remove, self.name(file))
+
+            self.files = found
+
+    def name(self, file):
+        return file[:len(file) - len(self.suffix)]
+
+    def close(self):
+        self.closed = True
+        self._wake.set()
+        if self._poller.is_alive():
+            self._poller.join()
+
+    def _notify(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            self.logger.exception("DirWatcher: Unable to apply a change to {}".format(args[0]))
+
+    def _poll_loop(self):
+        while not self.closed:
+            self._wake.wait(self.interval)
+            if self.closed:
+                break
+
+            try:
+                self.scan()
+            except OSError:
+                self.logger.exception("DirWatcher: Unable to scan {}".format(self.dir))
@@ -0,0 +1,159 @@
+import threading
+
+import numpy as np
+
+HOUR = 60 * 60
+DAY = HOUR * 24
+
+
+class Rollups:
+    """
+    Message activity totals kept up to date as messages arrive, so charts never rescan the message log.
+
+    Total message length is kept in hour and day buckets for four scopes: every chat, a single chat,
+    a single user across every chat, and a single user within a single chat. A scope is the pair
+    (chat, user), with None standing for "all". Range queries add whole day buckets and only fall back
+    to hour buckets at the edges, so a query over months touches a few dozen buckets at most.
+
+    ...
+
+    Methods
+    -------
+    add(date, user, length, chat)
+        Adds a single message to the totals
+
+    backfill(dates, users, lengths, chats)
+        Adds many messages at once from NumPy arrays, grouping them without a Python loop per message
+
+    series(start, end, chat=None, user=None, hourly=False)
+        Returns (buckets, totals) NumPy arrays for the day or hour buckets within [start, end)
+
+    total(start, end, chat=None, user=None)
+        Returns the total message length within [start, end), rounded out to whole hours
+
+    daily(chat=None, user=None)
+        Returns (days, totals) NumPy arrays sorted by day
+
+    hourly(chat=None, user=None)
+        Returns (hours, totals) NumPy arrays sorted by hour
+
+    by_user(chat=None)
+        Returns a list of (user, total) sorted by total, highest first
+
+    scope_version(chat=None, user=None)
+        Returns a number that changes whenever the totals of the scope (chat, user) change
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Maps of scope (chat, user) to maps of day (date // DAY) or hour (date // HOUR) to total message length
+        self.days = {}
+        self.hours = {}
+        # Maps of chat (None for every chat) to maps of username to total message length
+        self.users = {}
+        # Incremented on every change, letting callers tell whether the totals are unchanged
+        self.version = 0
+        # Map of scope (chat, user) to the number of changes made to its totals
+        self.versions = {}
+
+    @staticmethod
+    def scopes(chat, user):
+        return ((None, None), (None, user), (chat, None), (chat, user))
+
+    def add(self, date, user, length, chat):
+        day = date // DAY
+        hour = date // HOUR
+
+        with self.lock:
+            for scope in Rollups.scopes(chat, user):
+                days = self.days.setdefault(scope, {})
+                days[day] = days.get(day, 0) + length
+                hours = self.hours.setdefault(scope, {})
+                hours[hour] = hours.get(hour, 0) + length
+                self.versions[scope] = self.versions.get(scope, 0) + 1
+
+            for key in (None, chat):
+                users = self.users.setdefault(key, {})
+                users[user] = users.get(user, 0) + length
+            self.version += 1
+
+    def backfill(self, dates, users, lengths, chats):
+        dates = np.asarray(dates, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if not len(dates):
+            return
+
+        # Users and chats are replaced by small integer codes, -1 standing for "all"
+        user_names, user_codes = np.unique(np.asarray(users), return_inverse=True)
+        chat_ids, chat_codes = np.unique(np.asarray(chats, dtype=np.int64), return_inverse=True)
+        everyone = np.full(len(dates), -1, dtype=np.int64)
+
+        with self.lock:
+            for chat_column in (everyone, chat_codes.ravel()):
+                for user_column in (everyone, user_codes.ravel()):
+                    for totals, buckets in ((self.days, dates // DAY), (self.hours, dates // HOUR)):
+                        keys = np.stack((chat_column, user_column, buckets), axis=1)
+                        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+                        sums = np.bincount(inverse.ravel(), weights=lengths, minlength=len(unique)).astype(np.int64)
+
+                        for (chat, user, bucket), total in zip(unique.tolist(), sums.tolist()):
+                            scope = (int(chat_ids[chat]) if chat >= 0 else None, str(user_names[user]) if user >= 0 else None)
+                            scoped = totals.setdefault(scope, {})
+                            scoped[bucket] = scoped.get(bucket, 0) + total
+                            self.versions[scope] = self.versions.get(scope, 0) + 1
+
+                            if totals is self.days and scope[1] is not None:
+                                by_user = self.users.setdefault(scope[0], {})
+                                by_user[scope[1]] = by_user.get(scope[1], 0) + total
+            self.version += 1
+
+    def series(self, start, end, chat=None, user=None, hourly=False):
+        totals, size = (self.hours, HOUR) if hourly else (self.days, DAY)
+        first, last = start // size, (end - 1) // size
+
+        with self.lock:
+            scoped = totals.get((chat, user), {})
+            # Look buckets up one by one unless the range holds more buckets than the scope does
+            if last - first < len(scoped):
+                items = [(bucket, scoped[bucket]) for bucket in range(first, last + 1) if bucket in scoped]
+            else:
+                items = [(bucket, total) for bucket, total in scoped.items() if first <= bucket <= last]
+
+        items.sort()
+        return (np.array([bucket for bucket, _ in items], dtype=np.int64),
+                np.array([total for _, total in items], dtype=np.int64))
+
+    def total(self, start, end, chat=None, user=None):
+        # Whole days inside the range come from day buckets, the partial days at either edge from hour buckets
+        first_day, last_day = -(-start // DAY), end // DAY
+        if first_day >= last_day:
+            return int(self.series(start, end, chat, user, hourly=True)[1].sum())
+
+        edges = 0
+        if start < first_day * DAY:
+            edges += self.series(start, first_day * DAY, chat, user, hourly=True)[1].sum()
+        if last_day * DAY < end:
+            edges += self.series(last_day * DAY, end, chat, user, hourly=True)[1].sum()
+        return int(self.series(first_day * DAY, last_day * DAY, chat, user)[1].sum() + edges)
+
+    def daily(self, chat=None, user=None):
+        return self._series(self.days, chat, user)
+
+    def hourly(self, chat=None, user=None):
+        return self._series(self.hours, chat, user)
+
+    def by_user(self, chat=None):
+        with self.lock:
+            return sorted(self.users.get(chat, {}).items(), key=lambda item: item[1], reverse=True)
+
+    def scope_version(self, chat=None, user=None):
+        with self.lock:
+            return self.versions.get((chat, user), 0)
+
+    def _series(self, totals, chat, user):
+        with self.lock:
+            scoped = totals.get((chat, user), {})
+            keys = np.fromiter(scoped.keys(), dtype=np.int64, count=len(scoped))
+            values = np.fromiter(scoped.values(), dtype=np.int64, count=len(scoped))
+        order = np.argsort(keys)
+        return keys[order], values[order]
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+
+class Store:
+    """
+    Persistent key-value store backed by an embedded SQLite database in WAL mode.
+    Values may be anything that can be serialized to JSON.
+
+    Reads are served from an in-memory cache. Writes update the cache immediately and are
+    written behind in batches, either once batch_size keys are dirty or every flush_interval
+    seconds, so a mutation only costs the keys that actually changed. A batch that fails to
+    be written stays pending and is retried by the next flush. Changes made after close()
+    raise an exception rather than being lost.
+
+    ...
+
+    Methods
+    -------
+    get(key, default)
+        Returns the value stored under key, or default if it does not exist
+
+    set(key, value)
+        Stores value under key
+
+    delete(key)
+        Removes key from the store, returning True if it existed
+
+    keys(prefix)
+        Returns a sorted list of all keys starting with prefix
+
+    items(prefix)
+        Returns a sorted list of (key, value) tuples for all keys starting with prefix
+
+    flush()
+        Writes every pending change to disk in a single transaction
+
+    close()
+        Flushes pending changes and closes the database
+    """
+
+    _DELETED = object()
+
+    def __init__(self, path, flush_interval=5, batch_size=500):
+        """
+        Opens (creating if needed) the database found at path and starts the background flusher.
+
+        ...
+
+        Parameters
+        ----------
+        path: str
+            Path to the SQLite database file
+
+        flush_interval: float
+            Maximum number of seconds a change may stay in memory before being written
+
+        batch_size: int
+            Number of dirty keys that triggers an early flush
+        """
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.logger = logging.getLogger('bot_log')
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        # Map of keys to decoded values read from or written to the store
+        self.cache = {}
+        # Map of keys to JSON encoded values (or _DELETED) that have not been written to disk yet
+        self.dirty = {}
+        self.closed = False
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.db.commit()
+
+        self._wake = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="store-flusher", daemon=True)
+        self._flusher.start()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+            if key in self.dirty:
+                return default
+
+            row = self.db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+
+            value = json.loads(row[0])
+            self.cache[key] = value
+            return value
+
+    def set(self, key, value):
+        # Encoded straight away so a value that cannot be stored is refused here rather than failing every flush
+        encoded = json.dumps(value)
+
+        with self.lock:
+            self.check_open()
+            self.cache[key] = value
+            self.dirty[key] = encoded
+
+            if len(self.dirty) >= self.batch_size:
+                self._wake.set()
+
+    def delete(self, key):
+        with self.lock:
+            self.check_open()
+            existed = self.get(key, Store._DELETED) is not Store._DELETED
+            self.cache.pop(key, None)
+            self.dirty[key] = Store._DELETED
+            return existed
+
+    def keys(self, prefix=""):
+        return [key for key, value in self.items(prefix)]
+
+    def items(self, prefix=""):
+        with self.lock:
+            if prefix:
+                # Every key starting with prefix sorts between prefix and prefix followed by the highest code point
+                rows = self.db.execute("SELECT key, value FROM kv WHERE key >= ? AND key < ?",
+                                       (prefix, prefix + "\U0010ffff"))
+            else:
+                rows = self.db.execute("SELECT key, value FROM kv")
+
+            found = {}
+            for key, value in rows:
+                found[key] = self.cache[key] if key in self.cache else json.loads(value)
+
+            for key, value in self.dirty.items():
+                if key.startswith(prefix):
+                    if value is Store._DELETED:
+                        found.pop(key, None)
+                    else:
+                        found[key] = self.cache[key] if key in self.cache else json.loads(value)
+
+            return sorted(found.items())
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty or self.closed:
+                return
+
+            writes = [(key, value) for key, value in self.dirty.items() if value is not Store._DELETED]
+            deletes = [(key,) for key, value in self.dirty.items() if value is Store._DELETED]
+
+            # Only cleared once the transaction commits, a failed batch is rolled back and retried by the next flush
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", writes)
+                self.db.executemany("DELETE FROM kv WHERE key = ?", deletes)
+            self.dirty = {}
+
+    def check_open(self):
+        if self.closed:
+            raise Exception("Store: {} is closed, the change cannot be saved".format(self.path))
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.flush()
+            self.closed = True
+            self.db.close()
+        self._wake.set()
+
+    def _flush_loop(self):
+        while not self.closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception("Store: Unable to flush changes to {}, retrying in {} seconds".format(
+                    self.path, self.flush_interval))
@@ -0,0 +1,128 @@
+import bisect
+import difflib
+import re
+import threading
+
+
+def terms(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+class TextIndex:
+    """
+    In-memory index of documents by title and by the words of their text, without keeping the text itself.
+
+    Titles are kept in a sorted list for prefix lookups and matched approximately with difflib when nothing
+    starts with the query. Words map to the set of titles containing them, so memory grows with the number of
+    distinct words per document rather than with the length of the documents.
+
+    ...
+
+    Methods
+    -------
+    add(title, text)
+        Indexes a document, replacing any document with the same title
+
+    remove(title)
+        Removes a document from the index
+
+    find(query)
+        Returns the title best matching query, or None
+
+    search(query, limit)
+        Returns up to limit titles whose text contains the words of query, best matches first
+
+    titles()
+        Returns a list of every indexed title
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Map of lower case titles to titles, and the lower case titles in sorted order
+        self.by_title = {}
+        self.sorted_titles = []
+        # Map of words to the set of titles whose text contains them, and of titles to the words indexed for them
+        self.postings = {}
+        self.words = {}
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, title):
+        return title in self.words
+
+    def add(self, title, text):
+        with self.lock:
+            self._remove(title)
+
+            key = title.lower()
+            if key not in self.by_title:
+                bisect.insort(self.sorted_titles, key)
+            self.by_title[key] = title
+
+            self.words[title] = terms(text) | terms(title)
+            for word in self.words[title]:
+                self.postings.setdefault(word, set()).add(title)
+
+    def remove(self, title):
+        with self.lock:
+            self._remove(title)
+
+    def find(self, query):
+        key = query.strip().lower()
+        if not key:
+            return None
+
+        with self.lock:
+            if key in self.by_title:
+                return self.by_title[key]
+
+            # The shortest title starting with the query, found among the run of titles sorted after it that
+            # share its prefix (alphabetically first among equally short titles)
+            start = bisect.bisect_left(self.sorted_titles, key)
+            end = bisect.bisect_left(self.sorted_titles, key + "\U0010ffff", start)
+            if start < end:
+                return self.by_title[min(self.sorted_titles[start:end], key=len)]
+
+            close = difflib.get_close_matches(key, self.by_title.keys(), n=1, cutoff=0.7)
+            if close:
+                return self.by_title[close[0]]
+
+        found = self.search(query, 1)
+        return found[0] if found else None
+
+    def search(self, query, limit=10):
+        words = terms(query)
+
+        with self.lock:
+            # Titles are ranked by how many of the query's words their text contains
+            counts = {}
+            for word in words:
+                for title in self.postings.get(word, ()):
+                    counts[title] = counts.get(title, 0) + 1
+
+        return sorted(counts, key=lambda title: (-counts[title], title))[:limit]
+
+    def titles(self):
+        with self.lock:
+            return sorted(self.words, key=str.lower)
+
+    def _remove(self, title):
+        if title not in self.words:
+            return
+
+        key = title.lower()
+        if self.by_title.get(key) == title:
+            # Another title differing only in case takes its place
+            other = next((other for other in self.words if other != title and other.lower() == key), None)
+            if other:
+                self.by_title[key] = other
+            else:
+                del self.by_title[key]
+                del self.sorted_titles[bisect.bisect_left(self.sorted_titles, key)]
+
+        for word in self.words.pop(title):
+            titles = self.postings[word]
+            titles.discard(title)
+            if not titles:
+                del self.postings[word]
@@ -0,0 +1,75 @@
+import heapq
+import threading
+
+
+class TopWords:
+    """
+    Keeps the k longest distinct words seen within the last window seconds, in constant memory.
+
+    Words are held in a min-heap ordered by length, so a new word only has to beat the shortest word kept.
+    Seeing a kept word again refreshes its time instead of adding a duplicate. Words older than the window are
+    dropped once the heap is full, letting newer words replace them.
+
+    ...
+
+    Methods
+    -------
+    add(word, date)
+        Offers a word seen at date (seconds since the epoch)
+
+    top(now)
+        Returns the kept words seen within the window before now, longest first
+
+    clear()
+        Forgets every word
+    """
+
+    def __init__(self, k=25, window=24 * 60 * 60):
+        self.k = k
+        self.window = window
+        self.lock = threading.Lock()
+        # Min-heap of (length, word) and map of kept words to the last time they were seen
+        self.heap = []
+        self.dates = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def add(self, word, date):
+        with self.lock:
+            if word in self.dates:
+                self.dates[word] = max(self.dates[word], date)
+                return
+
+            if len(self.heap) >= self.k:
+                self._expire(date - self.window)
+
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, (len(word), word))
+            elif len(word) > self.heap[0][0]:
+                length, removed = heapq.heapreplace(self.heap, (len(word), word))
+                del self.dates[removed]
+            else:
+                return
+            self.dates[word] = date
+
+    def top(self, now):
+        with self.lock:
+            words = [word for length, word in self.heap if self.dates[word] >= now - self.window]
+        return sorted(words, key=len, reverse=True)
+
+    def clear(self):
+        with self.lock:
+            self.heap = []
+            self.dates = {}
+
+    def _expire(self, cutoff):
+        kept = [(length, word) for length, word in self.heap if self.dates[word] >= cutoff]
+        if len(kept) == len(self.heap):
+            return
+
+        for length, word in self.heap:
+            if self.dates[word] < cutoff:
+                del self.dates[word]
+        heapq.heapify(kept)
+        self.heap = kept
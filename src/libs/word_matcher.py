@@ -0,0 +1,93 @@
+import re
+import threading
+
+
+class WordMatcher:
+    """
+    Finds which of many words appears in a text by scanning it once with a single compiled regex.
+
+    The words are merged into a trie which is written out as one case insensitive pattern guarded by word
+    boundaries, so words sharing a prefix share a branch and the cost of a search barely grows with the number
+    of words. Adding or removing a word only marks the pattern stale; it is recompiled once on the next search,
+    however many changes were made in between.
+
+    ...
+
+    Methods
+    -------
+    add(word)
+        Adds a word if it does not exist
+
+    remove(word)
+        Removes a word if it exists
+
+    search(text)
+        Returns the word appearing earliest within text, or None if no word appears
+    """
+
+    def __init__(self, words=()):
+        self.lock = threading.Lock()
+        # Words in the order they were added, of several differing only in case the first is returned
+        self.words = list(dict.fromkeys(words))
+        self.pattern = None
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def add(self, word):
+        with self.lock:
+            if word not in self.words:
+                self.words.append(word)
+                self.pattern = None
+
+    def remove(self, word):
+        with self.lock:
+            if word in self.words:
+                self.words.remove(word)
+                self.pattern = None
+
+    def search(self, text):
+        with self.lock:
+            if self.pattern is None:
+                self.pattern, self.lookup = self.compile(self.words)
+            pattern, lookup = self.pattern, self.lookup
+
+        match = pattern.search(text) if lookup else None
+        if not match:
+            return None
+
+        found = match.group(0)
+        word = lookup.get(found.lower())
+        if word is None:
+            # Case insensitive matching also pairs characters whose lower case differs (such as the long s (ſ) with
+            # s or the Kelvin sign with k), then the word is found by matching each one against the text
+            word = next((word for word in lookup.values() if re.fullmatch(re.escape(word), found, re.IGNORECASE)), None)
+        return word
+
+    @staticmethod
+    def compile(words):
+        trie = {}
+        # Map of lower case words to the first word added with that spelling
+        lookup = {}
+        for word in words:
+            lookup.setdefault(word.lower(), word)
+            node = trie
+            for char in word.lower():
+                node = node.setdefault(char, {})
+            # An empty key marks the end of a word
+            node[""] = True
+
+        return re.compile(r"(?<!\w)" + WordMatcher.trie_pattern(trie) + r"(?!\w)", re.IGNORECASE), lookup
+
+    @staticmethod
+    def trie_pattern(node):
+        branches = [re.escape(char) + WordMatcher.trie_pattern(child) for char, child in node.items() if char]
+        if not branches:
+            return ""
+
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Words ending at this node make the rest of the branch optional
+        return "(?:" + pattern + ")?" if "" in node else pattern
@@ -1,5 +1,9 @@
+import os
+
 from abc import ABC, abstractmethod
 
+from libs.store import Store
+
 class Plugin:
     """
     Base class from which all plugins must inherit from.
@@ -34,11 +38,20 @@ class Plugin:
 
     disable()
         Called when the plugin is disabled by a user
+
+    get_store()
+        Returns a persistent key-value Store kept within this plugin's data directory
+
+    close_store()
+        Flushes and closes this plugin's Store if it has been opened
+
+    close()
+        Called when the plugin is unloaded because plugins are being reloaded or the bot is shutting down
     """
 
-    def __init__(self, data_dir, bot):
+    def __init__(self, data_dir, bot, resources=None):
         """
-        Main method of the plugin where it is given a reference to its directory and to the bot itself
+        Main method of the plugin where it is given a reference to its directory, to the bot itself and to the shared resources
 
         ...
 
@@ -49,9 +62,15 @@ class Plugin:
 
         bot: Bot
             A reference to the singleton Bot object that acts as the controller bridge between plugins and Telegram
+
+        resources: Resources, optional
+            Pooled HTTP sessions, database connections, executors and a cache shared between all plugins.
+            Only passed to plugins whose constructor accepts this third parameter.
         """
 
-        pass
+        self.dir = data_dir
+        self.bot = bot
+        self.resources = resources
 
     @abstractmethod
     def on_message(self, message):
@@ -145,3 +164,40 @@ class Plugin:
         """
 
         pass
+
+    def get_store(self):
+        """
+        Returns a persistent key-value Store kept within this plugin's data directory (self.dir), opening it on first use.
+
+        Values are cached in memory and written to disk in batches, so plugins may call set() on every change
+        without rewriting the rest of their data.
+        """
+
+        store = getattr(self, "_store", None)
+        if store is None or store.closed:
+            path = os.path.join(self.dir, "store.db")
+            resources = getattr(self, "resources", None)
+            store = resources.store(path) if resources else Store(path)
+            self._store = store
+        return store
+
+    def close_store(self):
+        """
+        Flushes and closes this plugin's Store if it has been opened.
+
+        Called by the PluginManager when the plugin is disabled, reloaded or the bot shuts down.
+        """
+
+        store = getattr(self, "_store", None)
+        if store is not None:
+            store.close()
+
+    def close(self):
+        """
+        Called when the plugin is unloaded because plugins are being reloaded or the bot is shutting down
+
+        Closes the plugin's Store. Plugins holding other resources (open files, buffers, threads) should
+        override this to release them and call Plugin.close(self)
+        """
+
+        self.close_store()
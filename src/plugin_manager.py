@@ -1,9 +1,12 @@
 import logging
 import importlib
+import inspect
 import os
 import threading
 
 from plugin import Plugin
+from profiler import Profiler
+from resources import Resources
 
 class PluginManager:
     """
@@ -17,6 +20,8 @@ class PluginManager:
     -------
     load_plugins(bot)
 
+    instantiate(class_, plugin, bot)
+
     dynamically_load(bot)
 
     reload_plugins(bot)
@@ -29,6 +34,12 @@ class PluginManager:
 
     disable_plugin(plugin_name)
 
+    on_config_reload(config, changed)
+
+    close_plugins()
+
+    shutdown()
+
     list_commands()
 
     list_listeners()
@@ -58,6 +69,10 @@ class PluginManager:
         self.logger = logging.getLogger('bot_log')
         # Reference to thread lock
         self.lock = threading.Lock()
+        # Resources shared between all Plugins, kept across reloads
+        self.resources = Resources(config)
+        # Profiler wrapping every Plugin on_command and on_message call
+        self.profiler = Profiler(os.path.join(config.bot_dir, "profiles"), config.profile_sample_interval)
         # List str of Plugin python files found in the Bot's config file to be imported and loaded
         self.config_plugins = config.plugins
         # List str of Plugin python files dynamically imported and loaded
@@ -77,6 +92,8 @@ class PluginManager:
         # Loads Plugins listed within the configuration file
         self.load_plugins(bot)
 
+        config.subscribe(self.on_config_reload)
+
     def load_plugins(self, bot):
         """
         Resets instance variables, imports plugins, and initalizes them to lists and maps.
@@ -92,6 +109,9 @@ class PluginManager:
             The main Bot object responsible for sending and receiving messages
         """
 
+        # Flushes state held by plugins about to be replaced
+        self.close_plugins()
+
         # Resets all instance variables for potential subsequent reloads
         self.plugins = []
         self.message_plugins = []
@@ -105,7 +125,7 @@ class PluginManager:
                 mod = importlib.import_module("plugins." + plugin, ".")
                 self.logger.info("Importing plugin.{}...".format(plugin))
                 class_ = getattr(mod, "BotPlugin")
-                self.plugins.append(class_(os.getcwd() + "/plugins/{}/".format(plugin), bot))
+                self.plugins.append(self.instantiate(class_, plugin, bot))
                 self.modules.append(mod)
                 self.logger.info("Successfully instantiated plugin!")
         else:
@@ -114,7 +134,7 @@ class PluginManager:
                 mod = importlib.reload(module)
                 self.logger.info("Attempting to reload plugin module with name {}...".format(module.__name__.split(".")[1]))
                 class_ = getattr(mod, "BotPlugin")
-                self.plugins.append(class_(os.getcwd() + "/plugins/{}/".format(module.__name__.split(".")[1]), bot))
+                self.plugins.append(self.instantiate(class_, module.__name__.split(".")[1], bot))
                 new_modules.append(mod)
                 self.logger.info("Successfully reloaded and instantiated plugin!")
             self.modules = new_modules
@@ -131,6 +151,30 @@ class PluginManager:
                 self.logger.info("Gave plugin {} message access".format(plugin.get_name()))
             self.is_enabled[plugin.get_name()] = True
 
+    def instantiate(self, class_, plugin, bot):
+        """
+        Creates a Plugin object from its class, passing the shared Resources if its constructor accepts them.
+
+        ...
+
+        Parameters
+        ----------
+        class_: class
+            The BotPlugin class found within the Plugin's module
+
+        plugin: str
+            The name of the Plugin's module, used to find its data directory
+
+        bot: Bot
+            The main Bot object responsible for sending and receiving messages
+        """
+
+        data_dir = os.getcwd() + "/plugins/{}/".format(plugin)
+
+        if len(inspect.signature(class_).parameters) >= 3:
+            return class_(data_dir, bot, self.resources)
+        return class_(data_dir, bot)
+
     def dynamically_load(self, bot):
         """
         NYI.
@@ -188,7 +232,8 @@ class PluginManager:
 
             if self.is_enabled[self.commands[message.command.command].get_name()]:
                 self.logger.info("Processing command ({}) for plugin ({})".format(message.command.command, self.commands[message.command.command].get_name()))
-                response = self.commands[message.command.command].on_command(message.command)
+                plugin = self.commands[message.command.command]
+                response = self.profiler.call(plugin.get_name(), plugin.on_command, message.command)
             else:
                 self.logger.warning("Unable to process command {} as it is disabled".format(message.command.command))
                 response =  {"type": "message", "message": "That command is currently disabled or does not exist."}
@@ -198,7 +243,7 @@ class PluginManager:
             if response["type"] == "message":
                 bot.send_message(message.chat.id, response["message"])
             elif response["type"] == "photo":
-                bot.send_photo(message.chat.id, response["caption"], response["file_name"])
+                bot.send_photo(message.chat.id, response["caption"], response["file_name"], response.get("data"))
         except KeyError:
             self.logger.warning("Unable to process command {} as it is invalid".format(message.command.command))
             bot.send_message(message.chat.id, "Invalid command!\n'" + message.command.command + "'")
@@ -226,14 +271,16 @@ class PluginManager:
 
         self.lock.acquire()
 
-        for plugin in self.message_plugins:
-            if self.is_enabled[plugin.get_name()]:
-                reply = plugin.on_message(message)
-
-                if reply:
-                    bot.send_message(message.chat.id, reply)
+        try:
+            for plugin in self.message_plugins:
+                if self.is_enabled[plugin.get_name()]:
+                    reply = self.profiler.call(plugin.get_name(), plugin.on_message, message)
 
-        self.lock.release()
+                    if reply:
+                        bot.send_message(message.chat.id, reply)
+        finally:
+            # Released even if a plugin raises, otherwise no further message would be processed
+            self.lock.release()
 
     def enable_plugin(self, plugin_name):
         """
@@ -281,12 +328,40 @@ class PluginManager:
                     self.logger.info("Disabnling plugin with name ({})".format(plugin.get_name()))
                     self.is_enabled[plugin_name] = False
                     plugin.disable()
+                    plugin.close_store()
                     return True
                 self.logger.warning("Unable to disable plugin with name ({}), it is already disabled".format(plugin.get_name()))
                 return False
         self.logger.warning("Unable to disable plugin with name ({}), it does not exist!".format(plugin_name))
         return False
 
+    def on_config_reload(self, config, changed):
+        """
+        Applies changed settings after the configuration file has been reloaded
+        """
+
+        self.profiler.sample_interval = config.profile_sample_interval
+
+    def close_plugins(self):
+        """
+        Calls the close() method of every loaded Plugin, flushing and releasing their resources.
+        Called before plugins are reloaded and when the bot shuts down.
+        """
+
+        for plugin in self.plugins:
+            try:
+                plugin.close()
+            except Exception:
+                self.logger.exception("Unable to close plugin {}".format(plugin.get_name()))
+
+    def shutdown(self):
+        """
+        Closes every Plugin along with the Resources shared between them.
+        """
+
+        self.close_plugins()
+        self.resources.close()
+
     def list_commands(self):
         """
         Returns a string detailing all Plugins and their registered commands
@@ -1,13 +1,20 @@
-from libs.bank import Bank
+import time
+
+from libs.bank import Bank, HISTORY_SIZE, POOL_PREFIX
 from plugin import Plugin
 
 class BotPlugin(Plugin):
-    def __init__(self, data_dir, bot):
+    def __init__(self, data_dir, bot, resources=None):
         self.dir = data_dir
         self.bot = bot
         self.currency_name = "doubloons"
-        self.betting_pool = 0
-        self.bank = Bank()
+        # Pool used by /ccbet and /ccpayout when no pool name is given
+        self.default_pool = "main"
+        # Share a single Bank with every other plugin using it
+        if resources:
+            self.bank = resources.shared("bank", lambda: Bank(backend=resources.config.bank_backend))
+        else:
+            self.bank = Bank()
 
     # Checks the balance of a user's account
     def balance(self, command):
@@ -38,55 +45,134 @@ class BotPlugin(Plugin):
 
         if amount <= 0:
             return "CCMP: Invalid amount. Please enter a positive value."
+        # Pools are only paid into through /ccbet
+        if to_user.startswith(POOL_PREFIX):
+            return "CCMP: That account does not exist. Ask them to run /ccbalance."
 
         if not self.bank.account_exists(from_user):
             self.bank.create_account(from_user)
         if not self.bank.account_exists(to_user):
             return "CCMP: That account does not exist. Ask them to run /ccbalance."
             
-        try:
-            if self.bank.charge(from_user, amount):
-                if self.bank.pay(to_user, amount):
-                    return "CCMP: {} has paid {} {} to {}!".format(from_user, amount, self.currency_name, to_user)
-                return "CCMP: Invalid amount of {}. Please enter a positive amount.".format(self.currency_name)
-        except TypeError:
-            return "CCMP: Invalid command format! Please enter /ccpay @user amount."
+        if self.bank.transfer(from_user, to_user, amount):
+            return "CCMP: {} has paid {} {} to {}!".format(from_user, amount, self.currency_name, to_user)
+        return "CCMP: You do not possess enough funds."
+
+    # Returns the account of a named betting pool within the command's chat, creating it if needed
+    def pool(self, command, name):
+        account = Bank.pool_account(command.chat.id, name)
+
+        if not self.bank.account_exists(account):
+            self.bank.create_account(account)
+        return account
 
     def bet(self, command):
         try:
             user = command.user.username
-            amount = int(command.args)
+            args = command.args.split()
+            amount = int(args[0])
+            pool = args[1] if len(args) > 1 else self.default_pool
+        except IndexError:
+            return "CCMP: Invalid command format! Please enter /ccbet [amount] [pool]."
+        except ValueError:
+            return "CCMP: Invalid command format! Please enter /ccbet [amount] [pool]."
 
-            if self.bank.charge(user, amount):
-                self.betting_pool += amount
-                return "CCMP: {} has added {} {} to the betting pool".format(user, amount, self.currency_name)
+        if amount <= 0:
+            return "CCMP: Invalid amount. Please enter a positive value."
+        if not self.bank.account_exists(user):
+            self.bank.create_account(user)
+        # Checked before the pool is created so failed bets do not leave empty pools behind, the transfer still
+        # checks the balance again atomically
+        if self.bank.get_balance(user) < amount:
             return "CCMP: You do not possess enough funds."
-        except TypeError:
-            return "CCMP: Invalid command format! Please enter /ccbet amount."
-        except ValueError:
-            return "CCMP: Invalid command format! Please enter /ccbet amount."
 
+        if self.bank.transfer(user, self.pool(command, pool), amount):
+            return "CCMP: {} has added {} {} to the {} betting pool".format(user, amount, self.currency_name, pool)
+        return "CCMP: You do not possess enough funds."
+
+    # Pays amount from a betting pool to each listed user in a single transaction
     def payout(self, command):
         try:
             user = command.user.username
-            args = command.args.split(" ")
-            to_user = args[0]
+            args = command.args.split()
+            to_users = [to_user.strip('@') for to_user in args[0].split(",") if to_user.strip('@')]
             amount = int(args[1])
-        except TypeError:
-            return "CCMP: Invalid command format! Please enter /ccpayout [user] [amount]."
+            pool = args[2] if len(args) > 2 else self.default_pool
+        except IndexError:
+            return "CCMP: Invalid command format! Please enter /ccpayout [user,...] [amount] [pool]."
         except ValueError:
-            return "CCMP: Invalid command format! Please enter /ccbet [user] [amount]."
+            return "CCMP: Invalid command format! Please enter /ccpayout [user,...] [amount] [pool]."
 
         if user == "Tanner" or user == "Klawk":
-            if amount > self.betting_pool or amount <= 0:
-                return "CCMP: Invalid amount specified. Must be greater than 0, and less than betting pool."
-            if self.bank.account_exists(to_user):
-                if self.bank.pay(to_user, amount):
-                    self.betting_pool -= amount
-                    return "CCMP: Paid {} {} {} from the betting pool.".format(to_user, amount, self.currency_name)
-            return "CCMP: That user does not yet have an account. Ask them to check their balance."    
+            if amount <= 0 or not to_users:
+                return "CCMP: Invalid amount specified. Must be greater than 0."
+            for to_user in to_users:
+                if not self.bank.account_exists(to_user):
+                    return "CCMP: {} does not yet have an account. Ask them to check their balance.".format(to_user)
+
+            postings = [(self.pool(command, pool), -amount * len(to_users))]
+            postings.extend((to_user, amount) for to_user in to_users)
+
+            if self.bank.apply(postings):
+                return "CCMP: Paid {} {} {} from the {} betting pool.".format(", ".join(to_users), amount, self.currency_name, pool)
+            return "CCMP: Invalid amount specified. The {} betting pool does not hold enough.".format(pool)
         return "CCMP: You do not have permission to use this command."
 
+    # Lists the balance of a single betting pool, or of every pool within the chat
+    def pools(self, command):
+        if command.args:
+            # Looking a pool up never creates it, pools that do not exist yet hold nothing
+            account = Bank.pool_account(command.chat.id, command.args)
+            balance = self.bank.get_balance(account) if self.bank.account_exists(account) else 0
+            return "CCMP: There are currently {} {} in the {} betting pool".format(balance, self.currency_name, command.args)
+
+        pools = self.bank.get_pools(command.chat.id)
+        if not pools:
+            return "CCMP: There are currently 0 {} in the betting pool".format(self.currency_name)
+
+        result = "CCMP: Betting pools:"
+        for name, balance in pools:
+            result += "\n{} - {} {}".format(name, balance, self.currency_name)
+        return result
+
+    # Lists a page of the user's transactions, newest first
+    def history(self, command):
+        user = command.user.username
+
+        try:
+            page = max(int(command.args), 1) if command.args else 1
+        except ValueError:
+            return "CCMP: Invalid command format! Please enter /cchistory [page]."
+
+        if not self.bank.account_exists(user):
+            return "CCMP: You do not yet have an account. Check your balance with /ccbalance."
+
+        postings = self.bank.get_history(user, page - 1)
+        if not postings:
+            return "CCMP: No transactions found on page {}.".format(page)
+
+        result = "CCMP: {}'s transactions (page {}):".format(user, page)
+        for amount, balance, when in postings:
+            result += "\n{} {:+d} {} (balance {})".format(time.strftime("%Y-%m-%d %H:%M", time.localtime(when)),
+                                                          amount, self.currency_name, balance)
+        return result
+
+    # Lists the accounts with the highest balances
+    def rich(self, command):
+        try:
+            count = min(max(int(command.args), 1), 50) if command.args else 10
+        except ValueError:
+            return "CCMP: Invalid command format! Please enter /ccrich [count]."
+
+        leaders = self.bank.get_leaderboard(count)
+        if not leaders:
+            return "CCMP: Nobody has an account yet."
+
+        result = "CCMP: Richest users:"
+        for rank, (name, balance) in enumerate(leaders, 1):
+            result += "\n{}. {} - {} {}".format(rank, name, balance, self.currency_name)
+        return result
+
     def setname(self, command):
         user = command.user.username
         new_name = command.args
@@ -109,12 +195,16 @@ class BotPlugin(Plugin):
             return {"type":"message", "message": self.setname(command)}
         elif command.command == "ccpayout":
             return {"type":"message", "message": self.payout(command)} 
+        elif command.command == "cchistory":
+            return {"type":"message", "message": self.history(command)}
+        elif command.command == "ccrich":
+            return {"type":"message", "message": self.rich(command)}
         elif command.command == "ccpool":
-            return {"type":"message", "message": "CCMP: There are currently {} {} in the betting pool".format(self.betting_pool, self.currency_name)}
+            return {"type":"message", "message": self.pools(command)}
 
     def get_commands(self):
         # Must return a set of command strings
-        return {"ccbalance", "ccpay", "ccbet", "ccsetname", "ccpayout", "ccpool"}
+        return {"ccbalance", "ccpay", "ccbet", "ccsetname", "ccpayout", "ccpool", "cchistory", "ccrich"}
 
     def get_name(self):
         # This should return the name of your plugin, perferably the same name as this class
@@ -124,10 +214,12 @@ class BotPlugin(Plugin):
         return "Custom Currancy Management Plug:\n" \
                "'/ccbalance' to see account balance\n" \
                "'/ccpay [user] [amount]' to pay a user\n" \
-               "'/ccbet [amount]' to put currency in the betting pool\n" \
+               "'/ccbet [amount] [pool]' to put currency in a betting pool\n" \
                "'/ccsetname [name]' to change the name of the currency\n" \
-               "'/ccpayout [user] [amount]' to payout from betting pool\n" \
-               "'/ccpool' to see the amount in the betting pool"
+               "'/ccpayout [user,...] [amount] [pool]' to pay each user from a betting pool\n" \
+               "'/ccpool [pool]' to see the amount in the betting pools\n" \
+               "'/cchistory [page]' to see your latest {} transactions\n" \
+               "'/ccrich [count]' to see the richest users".format(HISTORY_SIZE)
 
     def on_message(self, message):
         # Implementation not required
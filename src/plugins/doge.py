@@ -1,46 +1,107 @@
+import io
+import json
+import os
 import random
+import threading
+import time
+from libs.top_words import TopWords
 from plugin import Plugin
 from PIL import Image
 from PIL import ImageFont
 from PIL import ImageDraw
+from resources import Cache
+from response_wrappers import Responses
+
+# Seconds a word stays eligible for /doge after it was last said
+WORD_WINDOW = 24 * 60 * 60
+# Most words kept per chat, and so the most a template can draw
+MAX_WORDS = 8
+# Most chats whose words are kept, the least recently active chat being forgotten first
+MAX_CHATS = 4096
+# Template used by /doge when none is named
+DEFAULT_TEMPLATE = "doge"
 
 class BotPlugin(Plugin):
-	def __init__(self, data_directory, bot):
+	def __init__(self, data_directory, bot, resources=None):
 		self.dir = data_directory
 		self.bot = bot
 		self.parts = ["many", "very", "such", "much", "so", "wow"]
-		self.words = []
+		# TopWords of each chat, keeping at most MAX_WORDS words. They are the only record of what was said, so they
+		# are kept apart from the shared cache where other plugins' entries would evict them
+		self.words = Cache(MAX_CHATS)
 		self.colors = [(52, 255, 0), #Green
 					   (255, 0, 0), #Red
 					   (0, 0, 255), # Blue
 					   (255, 255, 0), #Yellow
 					   (255, 128, 0), #Orange
 					   (200, 0, 255)] #Purple
+		# Where words are drawn on templates without a <name>.json listing their own "coords"
 		self.coords = [(70, 100), (750, 200), (650, 460), (785, 700),(150, 600)]
-
-	def doge_it_up(self, words):
-		try:
-			image = Image.open(self.dir + "/doge.jpg")
-			draw = ImageDraw.Draw(image)
-
+		# Templates (.jpg or .png images within the data directory) and fonts, decoded once on first use
+		self.templates = {}
+		self.fonts = {}
+		self.lock = threading.Lock()
+
+	# Returns a map of template names to their image files
+	def find_templates(self):
+		if not os.path.exists(self.dir):
+			return {}
+		return {file.rsplit(".", 1)[0]: self.dir + "/" + file for file in os.listdir(self.dir)
+				if file.lower().endswith((".jpg", ".png")) and file != "output.jpg"}
+
+	# Returns the decoded (image, coords, font) of a template, or None if it does not exist
+	def get_template(self, name):
+		with self.lock:
+			if name not in self.templates:
+				path = self.find_templates().get(name)
+				if path is None:
+					return None
+
+				image = Image.open(path)
+				image.load()
+				settings = {}
+				if os.path.exists(self.dir + "/" + name + ".json"):
+					with open(self.dir + "/" + name + ".json", 'r') as f:
+						settings = json.load(f)
+
+				coords = [tuple(coord) for coord in settings.get("coords", self.coords)][:MAX_WORDS]
+				self.templates[name] = (image.convert("RGB"), coords, self.get_font(settings.get("font_size", 64)))
+			return self.templates[name]
+
+	def get_font(self, size):
+		if size not in self.fonts:
 			try:
-				font = ImageFont.truetype("/comic.ttf", 64)
-			except:
-				font = ImageFont.load_default()
-			random.shuffle(self.colors)
+				self.fonts[size] = ImageFont.truetype("/comic.ttf", size)
+			except OSError:
+				self.fonts[size] = ImageFont.load_default()
+		return self.fonts[size]
 
-			for word, color, coord in zip(words, self.colors, self.coords):
-				print(word)
-				draw.text(coord, word, color, font)
+	# Draws words onto a copy of the template, returning the picture as JPEG bytes
+	def doge_it_up(self, words, template):
+		image, coords, font = template
+		image = image.copy()
+		draw = ImageDraw.Draw(image)
+		colors = random.sample(self.colors, len(self.colors))
 
-			image.save(self.dir + "/output.jpg")
+		for word, color, coord in zip(words, colors, coords):
+			draw.text(coord, word, color, font)
 
-		except FileNotFoundError:
-			return "Unable to find file {}/doge.jpg".format(self.dir)
+		buffer = io.BytesIO()
+		image.save(buffer, format="JPEG")
+		return buffer.getvalue()
 
 	def on_command(self, command):
 		if command.command == "doge":
-			top_words = sorted(self.words, key=len, reverse=True)[:5]
+			name = command.args.strip()
+			if not name:
+				templates = self.find_templates()
+				name = DEFAULT_TEMPLATE if DEFAULT_TEMPLATE in templates or not templates else random.choice(list(templates))
+			template = self.get_template(name)
+			if template is None:
+				return {"type": "message", "message": "Unable to find template {}! Templates: {}".format(
+					name, ", ".join(sorted(self.find_templates())) or "none")}
+
+			top_words = self.chat_words(command.chat.id).top(time.time())[:len(template[1])]
 			random.shuffle(top_words)
 			words_to_draw = []
 
@@ -48,10 +109,9 @@ class BotPlugin(Plugin):
 				choice = random.choice(self.parts)
 				words_to_draw.append(choice if choice == "wow" else choice + " "+ word)
 
-			self.doge_it_up(words_to_draw)
-			self.words = []
-			return  {"type": "photo", "caption": "",
-					"file_name": self.dir+"/output.jpg"}
+			picture = self.doge_it_up(words_to_draw, template)
+			self.chat_words(command.chat.id).clear()
+			return Responses.respond_photo_data("", picture, name + ".jpg")
 
 	def get_commands(self):
 		return {"doge"}
@@ -60,22 +120,28 @@ class BotPlugin(Plugin):
 		return "Doge"
 
 	def get_help(self):
-		return "Sends doge pictures!"
+		return "Sends doge pictures!\n" \
+			   "/doge [template] to draw this chat's longest words on a template (.jpg or .png within the plugin's directory)"
 
 	def has_message_access(self):
 		return True
 
 	def on_message(self, message):
-		w = message.text.split(" ")
+		words = self.chat_words(message.chat.id)
 
-		for word in w:
-			if "http" in word:
-				w.remove(word)
-
-		self.words.extend(w)
+		for word in message.text.split(" "):
+			if word and "http" not in word:
+				words.add(word, message.date)
 
 		return ""
 
+	def chat_words(self, chat_id):
+		words = self.words.get(chat_id)
+		if words is None:
+			words = TopWords(MAX_WORDS, WORD_WINDOW)
+			self.words.set(chat_id, words)
+		return words
+
 	def enable(self):
 		pass
 
@@ -1,6 +1,10 @@
 import difflib
 
 from plugin import Plugin
+from profiler import Profiler
+
+# Longest a single /profile may run, as deterministic profiling slows every plugin call
+MAX_PROFILE_SECONDS = 300
 
 class BotPlugin(Plugin):
 	def __init__(self, data_directory, bot):
@@ -24,15 +28,57 @@ class BotPlugin(Plugin):
 			if self.bot.disable_plugin(command.args):
 				return {"type":"message", "message": "Successfully disabled {}.".format(command.args)}
 			return {"type":"message", "message": "Failed to disable {}, it may already be disabled or it does not exist!".format(command.args)}
+		elif command.command == "reloadconfig":
+			if not self.is_admin(command):
+				return {"type":"message", "message": "You do not have permission to use this command."}
+			try:
+				changed = self.bot.reload_config()
+			except Exception as e:
+				return {"type":"message", "message": "Failed to reload config, nothing was changed!\n{}".format(e)}
+			if changed:
+				return {"type":"message", "message": "Config reloaded, changed: {}".format(", ".join(changed))}
+			return {"type":"message", "message": "Config reloaded, nothing changed."}
+		elif command.command == "profile":
+			if not self.is_admin(command):
+				return {"type":"message", "message": "You do not have permission to use this command."}
+			return {"type":"message", "message": self.profile(command)}
+
+	# Admins are listed by username under admins within config.txt
+	def is_admin(self, command):
+		return command.user.username in self.bot.config.admins
+
+	def profile(self, command):
+		args = command.args.split()
+
+		if args and args[0] == "stop":
+			report = self.bot.stop_profiler()
+			return report if report else "The profiler is not running!"
+
+		try:
+			duration = float(args[0]) if args else 30
+			mode = args[1] if len(args) > 1 else "sampling"
+			top = int(args[2]) if len(args) > 2 else 10
+		except ValueError:
+			return "Invalid syntax! /profile [seconds] [sampling|deterministic] [top], or /profile stop"
+
+		if duration <= 0 or duration > MAX_PROFILE_SECONDS or top <= 0 or top > Profiler.MAX_TOP:
+			return "Profiling must last between 0 and {} seconds and list between 1 and {} functions!".format(
+				MAX_PROFILE_SECONDS, Profiler.MAX_TOP)
+		if self.bot.start_profiler(command.chat.id, mode, duration, top):
+			return "Profiling plugins ({}) for {} seconds...".format(mode, duration)
+		return "Unable to start profiling, it may already be running or {} is not a valid mode!".format(mode)
 
 	def get_commands(self):
-		return {"plugins", "reload", "enable", "disable", "help"}
+		return {"plugins", "reload", "enable", "disable", "help", "profile", "reloadconfig"}
 
 	def get_name(self):
 		return "Plugin Manager"
 
 	def get_help(self):
-		return "This plugin manages general plugins"
+		return "This plugin manages general plugins\n" \
+			   "/reloadconfig to apply changes made to config.txt without restarting (admins only)\n" \
+			   "/profile [seconds] [sampling|deterministic] [top] to profile plugins (admins only)\n" \
+			   "/profile stop to stop profiling early"
 
 	def has_message_access(self):
 		return False
@@ -1,66 +1,110 @@
 import os
 import random
+from libs.dir_watcher import DirWatcher
+from libs.text_index import TextIndex
 from plugin import Plugin
+from resources import Cache
 
 class BotPlugin(Plugin):
-	def __init__(self, data_dir, bot):
+	def __init__(self, data_dir, bot, resources=None):
 		self.dir = data_dir
-		self.pasta = {}
+		self.bot = bot
+		self.resources = resources
+		# Titles and words of every pasta, their bodies stay on disk
+		self.index = TextIndex()
+		# Recently sent pasta bodies, in the cache shared by plugins when available
+		self.bodies = resources.cache if resources else Cache(32)
 		if not os.path.exists(self.dir):
 			os.makedirs(self.dir)
-		for file in os.listdir(self.dir):
-			if file.endswith(".txt"):
-				with open(self.dir+"/"+file, 'r') as f:
-					self.pasta[file[:-4]] = f.read()
+		# Pasta files edited on disk are applied without reloading the plugin
+		self.watcher = DirWatcher(self.dir, self.load_pasta, self.unload_pasta)
+		self.watcher.scan()
+		self.watcher.start()
+
+	def load_pasta(self, title, path):
+		with open(path, 'r') as f:
+			self.index.add(title, f.read())
+		self.bodies.delete(("Pasta", title))
+
+	def unload_pasta(self, title):
+		self.index.remove(title)
+		self.bodies.delete(("Pasta", title))
+
+	# Returns the body of a pasta, reading it from disk unless it was sent recently
+	def read_pasta(self, title):
+		body = self.bodies.get(("Pasta", title))
+		if body is None:
+			with open(self.dir+"/"+title+".txt", 'r') as f:
+				body = f.read()
+			self.bodies.set(("Pasta", title), body)
+		return body
 
 	def add(self, message):
 		parts = message.split("\n",1)
 		if len(parts) == 2 and parts[0] and parts[1]:
 			file_name = parts[0] + ".txt"
-			self.pasta[parts[0]] = parts[1]
 			with open(self.dir+"/"+file_name, 'w') as f:
 				f.write(parts[1])
+			self.index.add(parts[0], parts[1])
+			self.bodies.set(("Pasta", parts[0]), parts[1])
 			return "Created pasta '" + parts[0] + "''"
 		else:
 			return "Invalid syntax! Please enter pasta title on first line and begin pasta on next line"
 
+	# Returns the pasta whose title best matches message (exactly, by prefix, approximately or by its text),
+	# or a random pasta if none match
 	def get_pasta(self, message):
-		if(message in self.pasta.keys()):
-			return self.pasta[message]
-		if len(self.pasta) > 0:
-			return self.pasta[random.choice(list(self.pasta.keys()))]
+		title = self.index.find(message)
+		if title:
+			return self.read_pasta(title)
+		titles = self.index.titles()
+		if len(titles) > 0:
+			return self.read_pasta(random.choice(titles))
 		else:
 			return "No pasta set!"
 
+	def search(self, message):
+		titles = self.index.search(message)
+		if titles:
+			return "\n".join(titles)
+		return "No pasta contains those words!"
+
 	def on_command(self, command):
 		if command.command == "pasta":
 			return {"type":"message", "message": self.get_pasta(command.args)}
 		elif command.command == "listpasta":
-			ret = "\n".join(list(self.pasta.keys()))
+			ret = "\n".join(self.index.titles())
 			if ret:
 				return {"type":"message", "message": ret}
 			else:
 				 return {"type":"message", "message": "No pasta set!"}
+		elif command.command == "searchpasta":
+			return {"type":"message", "message": self.search(command.args)}
 		elif command.command == "newpasta":
 			return {"type":"message", "message": self.add(command.args)}
 
 	def get_commands(self):
-		return {"pasta", "listpasta", "newpasta"}
+		return {"pasta", "listpasta", "searchpasta", "newpasta"}
 
 	def get_name(self):
 		return "Pasta"
 
 	def get_help(self):
-		return "/pasta <name (optional)>"
+		return "/pasta <name (optional)>\n" \
+			   "/searchpasta <words> to list pasta containing them"
 
 	def on_message(self, message):
 		pass
 
 	def has_message_access(self):
 		return False
-	
+
 	def enable(self):
 		pass
 
 	def disable(self):
-		pass
\ No newline at end of file
+		pass
+
+	def close(self):
+		self.watcher.close()
+		Plugin.close(self)
@@ -1,44 +1,12 @@
-import random
 import os
-import re
 import pickle
 
+from config import Config
+from libs import dice
 from plugin import Plugin
 
-"""
-Class for handling dice rolls
-"""
-class Roll():
-    def __init__(self, init_string):
-        init_string = init_string.lower()
-        parts = init_string.split("d")
-
-        if parts[0]:
-            self.num = max(int(parts[0]), 1)  # How many dice to roll
-        else:
-            self.num = 1
-
-        if parts[1]:
-            self.size = int(parts[1])  # The size of the dice (i.e. d20)
-
-            if self.size < 1:
-                self.size = 1  # The size of the dice must be greater than 1
-        else:
-            self.size = 1
-
-        self.rolls = []  # A list containing all rolls made
-        self.roll()  # Rolls self.num dice of dice size self.size and stores them in self.rolls
-
-    def roll(self):
-        if self.rolls:
-            return self.rolls
-        for i in range(self.num):
-            self.rolls.append(random.randint(1, self.size))
-        return self.rolls
-
-    def sum(self):
-        return sum(self.rolls)
-
+DICE_HELP = "Dice expressions add and subtract terms such as 2d6, 4d6kh3 (keep highest 3), 2d20kl1, 4d6dl1 " \
+            "(drop lowest 1), 3d6! (exploding), 5, (1d4+1) or a character stat with |<char> (ex. 1d20+dex|Bob)"
 
 """
 Holds information on a player character utilizing dictionaries for stats and inventory
@@ -185,14 +153,20 @@ class CharacterManager:
 Main Plugin class that manages command usage
 """
 class BotPlugin(Plugin):
-    def __init__(self, data_dir, bot):
+    def __init__(self, data_dir, bot, resources=None):
         self.dir = data_dir
+        self.bot = bot
+        self.resources = resources
+        # Bot config for dice limits, which reflects reloads, or the default settings without resources
+        self.config = resources.config if resources else Config()
         self.manager = CharacterManager(self.dir)
         self.dm = ["Klawk"]
 
     def on_command(self, command):
         if command.command == "r" or command.command == "roll":
             return {"type": "message", "message": self.roll_dice(command)}
+        elif command.command == "odds":
+            return {"type": "message", "message": self.odds(command)}
         elif command.command == "create_character":
             return {"type": "message", "message": self.create_character(command)}
         elif command.command == "show_stats":
@@ -225,14 +199,15 @@ class BotPlugin(Plugin):
             return {"type": "message", "message": self.rm_dm(command)}
 
     def get_commands(self):
-        return {"r", "roll", "create_character", "show_stats", "show_inventory", "show_abilities", "set_stat",
+        return {"r", "roll", "odds", "create_character", "show_stats", "show_inventory", "show_abilities", "set_stat",
                 "give_item", "give_ability", "rm_stat", "rm_item", "rm_ability", "rm_char", "chars", "consume", "set_dm", "rm_dm"}
 
     def get_name(self):
         return "RPG Tools"
 
     def get_help(self):
-        return "/roll <dice_expression>\n" \
+        return "/roll <dice_expression>[|<char>]\n" \
+               "/odds <dice_expression>[|<char>] [target]\n" \
                "/create_character <name>\n" \
                "/show_stats <char>\n" \
                "/show_inventory <char>\n" \
@@ -263,44 +238,66 @@ class BotPlugin(Plugin):
 
     def roll_dice(self, command):
         user = command.mention if command.mention else command.user.username
-        rolls = []
-        constant = []
-        mods = []
-        parts = command.args.split("+")
-        for part in parts:
-            if "-" in part:
-                try:
-                    index = part.index("-", 1)
-                    new_part = part[index:]
-                    part = part[:index]
-                    parts.append(new_part)
-                except:
-                    pass  # part is just a plain negative number
-            part = part.strip()
-            if re.search("\d+[dD]\d+", part):
-                rolls.append(Roll(part))
-            elif part.replace("-", "", 1).isdigit():
-                constant.append(int(part))
-            else:
-                char_name = command.args.split("|")
-                if self.manager.has_character(user, char_name[1]) and part in\
-                        self.manager.get_character(char_name[1]).stats:
-                    mods.append(part)
+        # Stats are read from the character named after "|" (ex. /roll 1d20+dex|Bob)
+        expression, _, char_name = command.args.partition("|")
+        stats, error = self.character_stats(command, user, char_name.strip())
+        if error:
+            return error
+
+        try:
+            total, lines = dice.roll(expression.strip(), stats, max_dice=self.config.dice_max_count,
+                                     detail_limit=self.config.dice_detail_limit)
+        except ValueError as e:
+            return "Invalid dice expression! {}\n".format(e) + DICE_HELP
+
         result = user + " rolled:"
-        total = 0
-        for roll in rolls:
-            total += roll.sum()
-            result += "\n(" + ", ".join(str(s) for s in roll.rolls) + ") = " + str(roll.sum())
-        for mod in mods:
-            mod_value = int((self.manager.get_character(user).stats[mod] - 10) / 2)
-            total += mod_value
-            result += "\n + " + mod + " (" + str(mod_value) + ")"
-        for c in constant:
-            total += c
-            result += "\n + " + str(c)
+        for line in lines:
+            result += "\n" + line
         result += "\n = " + str(total)
         return result
 
+    # Returns (stats, None) for the character a roll refers to, or (None, error) if user may not use it
+    def character_stats(self, command, user, char_name):
+        if not char_name:
+            return {}, None
+        if not self.manager.char_exists(char_name):
+            return None, "RPGTools: That character does not exist!"
+        if not self.manager.has_character(user, char_name) and command.user.username not in self.dm:
+            return None, user + " did not create that character!"
+        return self.manager.get_character(char_name).stats, None
+
+    def odds(self, command):
+        user = command.mention if command.mention else command.user.username
+        args = command.args.strip()
+        target = None
+
+        # A trailing number is the target, unless it belongs to the expression (ex. 1d20 + 5)
+        head, _, last = args.rpartition(" ")
+        if head and last.lstrip("-").isdigit():
+            try:
+                dice.parse(head.partition("|")[0].strip())
+                args, target = head, int(last)
+            except ValueError:
+                pass
+
+        expression, _, char_name = args.partition("|")
+        stats, error = self.character_stats(command, user, char_name.strip())
+        if error:
+            return error
+
+        try:
+            distribution = dice.odds(expression.strip(), stats, max_dice=self.config.dice_max_count)
+        except ValueError as e:
+            return "Invalid dice expression! {}\n".format(e) + DICE_HELP
+
+        result = "Odds of {}:".format(dice.parse(expression.strip()))
+        result += "\nMean {:.2f}, from {} to {}".format(distribution.mean(), distribution.lowest(), distribution.highest())
+        result += "\nPercentiles: " + ", ".join("{}%: {}".format(percent, distribution.percentile(percent / 100))
+                                                for percent in (5, 25, 50, 75, 95))
+        if target is not None:
+            result += "\nChance of {} or more: {:.2f}%".format(target, distribution.at_least(target) * 100)
+        return result
+
     def show_stats(self, command):
         user = command.user.username
         char = command.args
@@ -1,70 +1,150 @@
 import os
+import re
+import time
+from datetime import datetime, timezone
 
-import numpy as np
-import matplotlib.pyplot as plt
-
+from libs import charts
+from libs.buffered_writer import BufferedWriter
+from libs.columnar_log import ColumnarLog
+from libs.rollups import DAY, HOUR, Rollups
 from plugin import Plugin
+from resources import Cache
+from response_wrappers import Responses
+
+# Seconds covered by each named /plot range
+RANGES = {"day": DAY, "week": 7 * DAY, "month": 30 * DAY, "year": 365 * DAY}
+# Renderer within libs.charts used for each chart type, matplotlib is only imported if a chart type uses it
+CHART_RENDERERS = {"activity": "pillow"}
 
 class BotPlugin(Plugin):
-	def __init__(self, data_directory, bot):
+	def __init__(self, data_directory, bot, resources=None):
 		self.dir = data_directory
 		self.bot = bot
+		# Rendered charts keyed by query and data version, in the cache shared by plugins when available
+		self.charts = resources.cache if resources else Cache(64)
 		if not os.path.exists(self.dir):
 			os.makedirs(self.dir)
+		# Activity totals updated per message, so /plot never rereads the log
+		self.rollups = Rollups()
+		# Messages are stored column by column under log/, read back through memory mapping
+		self.columns = ColumnarLog(self.dir+"/log")
+		self.migrate()
+		self.backfill()
+		# Records are appended to the log in batches rather than for every message
+		self.log = BufferedWriter(self.columns.append, batch_size=500, flush_interval=10)
+
+	# Converts a log.csv written by earlier versions into the columnar log, once
+	def migrate(self):
+		if not os.path.exists(self.dir+"/log.csv"):
+			return
+
+		if os.path.getsize(self.dir+"/log.csv") > 0:
+			self.columns.import_csv(self.dir+"/log.csv")
+		os.rename(self.dir+"/log.csv", self.dir+"/log.csv.migrated")
+
+	# Loads totals for messages logged before this plugin was created
+	def backfill(self):
+		columns = self.columns.columns()
+		if not len(columns["date"]):
+			return
+
+		self.rollups.backfill(columns["date"], self.columns.usernames()[columns["user"]], columns["length"], columns["chat"])
 
 	def get_name(self):
 		return "Stats"
 
 	def get_help(self):
-		return "Don't mind me, just listening to your messages..."
+		return "Don't mind me, just listening to your messages...\n" \
+			   "/plot [day|week|month|year|all|<n>d|<n>h|YYYY-MM-DD [YYYY-MM-DD]] [@user] [global] to chart activity\n" \
+			   "Charts cover this chat over the last month unless told otherwise"
 
 	def get_commands(self):
 		return {"plot"}
 
 	def on_command(self, command):
 		if command.command == "plot":
-			self.plot()
-			return  {"type": "photo", "caption": "",
-					"file_name": self.dir+"/output.jpg"}
+			try:
+				query = self.parse_query(command)
+			except ValueError:
+				return {"type": "message", "message": "Invalid syntax! " + self.get_help().split("\n")[1]}
+
+			chart = self.plot(*query)
+			if not chart:
+				return {"type": "message", "message": "No messages were logged for that query!"}
+			return Responses.respond_photo_data("", chart, "plot.jpg")
 
 	def has_message_access(self):
 		return True
 
 	def on_message(self, message):
-		with open(self.dir+"/log.csv", 'a') as f:
-			f.write(",".join((str(message.date), message.sent_from.username, str(len(message.text))))+"\n")
+		self.rollups.add(message.date, message.sent_from.username, len(message.text), message.chat.id)
+		self.log.append((message.date, message.sent_from.username, len(message.text), message.chat.id))
 
 	def enable(self):
 		pass
 
 	def disable(self):
-		pass
+		self.log.flush()
 
-	def plot(self):
-		data = np.genfromtxt(self.dir+"/log.csv", delimiter=',', names=['date', 'name', 'length'])
-		chatMap = {}
-		for x in data:
-			date = np.int64(np.int64(x[0])/(60*60*24))
-			if date in chatMap:
-				#print("same date!")
-				chatMap[date] += x[2]
+	def close(self):
+		self.log.close()
+		Plugin.close(self)
+
+	# Returns (start, end, chat, user) from "/plot [range] [@user] [global]", raising ValueError on bad syntax
+	def parse_query(self, command):
+		end = int(time.time()) + 1
+		start = end - RANGES["month"]
+		chat = command.chat.id
+		user = command.mention or None
+		dates = []
+
+		for arg in command.args.split():
+			if arg.startswith("@"):
+				continue
+			elif arg == "global":
+				chat = None
+			elif arg == "all":
+				start = 0
+			elif arg in RANGES:
+				start = end - RANGES[arg]
+			elif re.fullmatch("\\d+[dh]", arg):
+				start = end - int(arg[:-1]) * (DAY if arg[-1] == "d" else HOUR)
 			else:
-				chatMap[date] = x[2]
-		#print(chatMap)
-		#[(np.int64(np.int64(x[0])/3), x[1], x[2]) for x in data]
-
-		data = np.array(list(chatMap.items()), dtype=[('date', '<i8'), ('length', '<f8')])
-		'''
-		print(data['length'])
-		print(len(data['length']))
-		plt.bar(len(data['length']), data['length'], .5, color="blue")
-		fig = plt.gcf()
-		'''
-		fig = plt.figure()
-		ax1 = fig.add_subplot(111)
-		ax1.set_title("Activity")
-		ax1.set_xlabel('Date')
-		ax1.set_ylabel('length')
-		ax1.plot(data['date'], data['length'], 'ro-')
-		#plt.plot([1,2,3,4], [1,4,9,16], 'ro')
-		fig.savefig(self.dir+"/output.jpg")
+				dates.append(int(datetime.strptime(arg, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()))
+
+		if len(dates) > 2:
+			raise ValueError("Too many dates")
+		if dates:
+			start = dates[0]
+			end = dates[1] + DAY if len(dates) > 1 else end
+		if start >= end:
+			raise ValueError("Empty range")
+		return start, end, chat, user
+
+	# Returns the chart of activity between start and end as JPEG bytes, empty if nothing was logged
+	def plot(self, start, end, chat=None, user=None):
+		# Ranges up to two days are charted by hour, longer ranges by day
+		hourly = end - start <= 2 * DAY
+		size = HOUR if hourly else DAY
+		# Aligning the range to whole buckets lets repeated queries share a cached chart
+		start, end = start // size * size, -(-end // size) * size
+
+		key = ("Stats", start, end, chat, user, self.rollups.scope_version(chat, user))
+		chart = self.charts.get(key)
+		if chart is None:
+			chart = self.render(start, end, chat, user, hourly)
+			self.charts.set(key, chart)
+		return chart
+
+	def render(self, start, end, chat, user, hourly):
+		size = HOUR if hourly else DAY
+		buckets, totals = self.rollups.series(start, end, chat, user, hourly)
+		if not len(buckets):
+			return b""
+
+		title = "Activity" + (" of " + user if user else "") + (" in this chat" if chat is not None else " in every chat")
+		dates = [datetime.fromtimestamp(bucket * size, timezone.utc) for bucket in buckets.tolist()]
+
+		return charts.line_chart(dates, totals, "{} ({} total)".format(title, self.rollups.total(start, end, chat, user)),
+								 'Hour' if hourly else 'Date', 'length', "%m-%d %H:00" if hourly else "%Y-%m-%d",
+								 CHART_RENDERERS["activity"])
@@ -1,9 +1,11 @@
 from plugin import Plugin
 
 class BotPlugin(Plugin):
-    def __init__(self, data_dir, bot):
+    def __init__(self, data_dir, bot, resources=None):
         self.dir = data_dir
         self.bot = bot
+        # Shared HTTP sessions, database pools, executors and cache (see resources.py)
+        self.resources = resources
 
     def on_message(self, message):
         # Implement this if has_message_access returns True
@@ -1,61 +1,114 @@
 import os
 import random
-import re
+from libs.dir_watcher import DirWatcher
+from libs.word_matcher import WordMatcher
 from plugin import Plugin
+from resources import Cache
 
 class BotPlugin(Plugin):
-	def __init__(self, trigger_directory, bot):
+	def __init__(self, trigger_directory, bot, resources=None):
 		self.dir = trigger_directory
+		self.bot = bot
+		self.resources = resources
+		# Global triggers, found in every chat, are stored as one .txt file per trigger
 		self.triggers = {}
 		if not os.path.exists(self.dir):
 			os.makedirs(self.dir)
-		for file in os.listdir(self.dir):
-			if file.endswith(".txt"):
-				with open(self.dir+"/"+file, 'r') as f:
-					responses = []
-					for line in f.read().splitlines():
-						if line:
-							responses.append(line)
-					self.triggers[file[:-4]] = responses
+		# Every trigger compiled into one pattern, so each message is scanned once
+		self.matcher = WordMatcher()
+		# Trigger files edited on disk are applied without reloading the plugin
+		self.watcher = DirWatcher(self.dir, self.load_trigger, self.unload_trigger)
+		self.watcher.scan()
+		self.watcher.start()
+		# Triggers of a single chat are stored under "chat:<id>:<trigger>" within the plugin's store and only
+		# loaded once that chat is active, into a bounded cache of (matcher, responses)
+		self.chats = resources.cache if resources else Cache(256)
 
 	def on_message(self, message):
-		for word in self.triggers.keys():
-			#word = word.lower()
-			exp = r'\b'+ word + r'\b'
-			#message = message.lower()
-			if re.search(exp, message.text, re.IGNORECASE):
-				return random.choice(self.triggers[word])
+		# Responses are looked up with get() as the watcher thread may unload a trigger after it was matched
+		matcher, triggers = self.chat_triggers(message.chat.id)
+		word = matcher.search(message.text)
+		responses = triggers.get(word) if word else None
+		if responses:
+			return random.choice(responses)
+
+		word = self.matcher.search(message.text)
+		responses = self.triggers.get(word) if word else None
+		if responses:
+			return random.choice(responses)
 		return ""
 
 	def on_command(self, command):
 		if command.command == "newtrigger":
+			return {"type": "message", "message": self.add(command, command.chat.id)}
+		elif command.command == "newglobaltrigger":
 			return {"type": "message", "message": self.add(command)}
+		elif command.command == "deltrigger":
+			return {"type": "message", "message": self.remove(command)}
 		elif command.command == "listtrigger":
-			ret = "\n".join(list(self.triggers.keys()))
+			matcher, triggers = self.chat_triggers(command.chat.id)
+			ret = "\n".join(list(triggers.keys()))
+			if self.triggers:
+				ret += "\n\nGlobal:\n" + "\n".join(list(self.triggers.keys()))
 			if ret:
-				return {"type": "message", "message": ret}
+				return {"type": "message", "message": ret.strip()}
 			else:
 				return {"type": "message", "message": "No triggers set!"}
 
 	def get_commands(self):
-		return {"newtrigger", "listtrigger"}
+		return {"newtrigger", "newglobaltrigger", "deltrigger", "listtrigger"}
 
 	def get_name(self):
 		return "Trigger!"
 
 	def get_help(self):
-		return "This plugin has no help set"
+		return "/newtrigger <trigger> followed by one response per line to add a trigger to this chat\n" \
+			   "/newglobaltrigger <trigger> followed by one response per line to add a trigger to every chat\n" \
+			   "/deltrigger <trigger> to remove a trigger from this chat\n" \
+			   "/listtrigger to list the triggers of this chat"
 
 	def has_message_access(self):
 		return True
 
 	def enable(self):
 		pass
-	
+
 	def disable(self):
 		pass
-		
-	def add(self, command):
+
+	def close(self):
+		self.watcher.close()
+		Plugin.close(self)
+
+	def load_trigger(self, word, path):
+		with open(path, 'r') as f:
+			responses = []
+			for line in f.read().splitlines():
+				if line:
+					responses.append(line)
+		if responses:
+			self.triggers[word] = responses
+			self.matcher.add(word)
+		else:
+			self.unload_trigger(word)
+
+	def unload_trigger(self, word):
+		self.triggers.pop(word, None)
+		self.matcher.remove(word)
+
+	# Returns the (matcher, responses) of a chat's triggers, loading them from the store if they are not cached
+	def chat_triggers(self, chat_id):
+		key = ("Trigger", chat_id)
+		entry = self.chats.get(key)
+		if entry is None:
+			prefix = "chat:{}:".format(chat_id)
+			triggers = {key[len(prefix):]: responses for key, responses in self.get_store().items(prefix)}
+			entry = (WordMatcher(triggers.keys()), triggers)
+			self.chats.set(key, entry)
+		return entry
+
+	# Adds a trigger to the chat with chat_id, or a global trigger when chat_id is None
+	def add(self, command, chat_id=None):
 		parts = command.args.splitlines()
 		if len(parts) > 1 and parts[0]:
 			file_name = parts[0] + ".txt"
@@ -66,11 +119,30 @@ class BotPlugin(Plugin):
 						output += response +"\n"
 						final_responses.append(response)
 			if output:
+				if chat_id is not None:
+					matcher, triggers = self.chat_triggers(chat_id)
+					triggers[parts[0]] = final_responses
+					matcher.add(parts[0])
+					self.get_store().set("chat:{}:{}".format(chat_id, parts[0]), final_responses)
+					return "Added trigger: " + parts[0]
+
 				self.triggers[ parts[0]] = final_responses
+				self.matcher.add(parts[0])
 				with open(self.dir+"/"+file_name, 'w') as f:
 					f.write(output)
-				return "Added trigger: " + parts[0]
+				return "Added global trigger: " + parts[0]
 			else:
 				return "Must have at least one valid response"
 		else:
 			return "Invalid syntax"
+
+	def remove(self, command):
+		word = command.args.strip()
+		matcher, triggers = self.chat_triggers(command.chat.id)
+		if word not in triggers:
+			return "No trigger {} is set in this chat!".format(word)
+
+		del triggers[word]
+		matcher.remove(word)
+		self.get_store().delete("chat:{}:{}".format(command.chat.id, word))
+		return "Removed trigger: " + word
@@ -0,0 +1,282 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+from collections import Counter
+
+class Profiler:
+    """
+    Profiles Plugin calls made by the PluginManager for a limited window of time while the bot is running.
+
+    Two modes are supported:
+        "sampling" periodically records the stacks of threads running a Plugin call, adding very little overhead.
+        "deterministic" runs every Plugin call under cProfile, giving exact call counts at a higher cost.
+
+    In both modes the time spent within each Plugin's on_command and on_message methods is recorded.
+    When a window ends the full profile is written to output_dir and a report of the top functions is returned.
+
+    ...
+
+    Methods
+    -------
+    start(mode, duration, top, on_finish)
+        Starts profiling for duration seconds
+
+    stop()
+        Stops profiling early, returning the report
+
+    call(plugin_name, func, *args)
+        Calls func with args, recording its cost against plugin_name while profiling is active
+
+    is_active()
+        Returns True while a profiling window is running
+    """
+
+    MODES = ("sampling", "deterministic")
+    # Most functions a report may list, and the most characters it may have to fit in one Telegram message
+    MAX_TOP = 25
+    MAX_REPORT_LENGTH = 4096
+
+    def __init__(self, output_dir, sample_interval=0.005):
+        """
+        Parameters
+        ----------
+        output_dir: str
+            Directory full profiles are written to
+
+        sample_interval: float
+            Seconds between stack samples in sampling mode
+        """
+
+        self.logger = logging.getLogger('bot_log')
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+        self.active = False
+        self.mode = None
+        self.top = 10
+        self.on_finish = None
+        self.started = 0
+        self.timer = None
+        self.sampler = None
+        # Map of Plugin names to [number of calls, total seconds]
+        self.timings = {}
+        # Merged cProfile statistics in deterministic mode
+        self.stats = None
+        # Counters of samples where a function was running (self) or on the stack (cumulative) in sampling mode
+        self.self_samples = Counter()
+        self.cumulative_samples = Counter()
+        # Counter of collapsed stacks written out as the full profile in sampling mode
+        self.stacks = Counter()
+        self.sample_count = 0
+        # Counter of the idents of threads currently within call(), the only threads sampled
+        self.calling = Counter()
+
+    def is_active(self):
+        return self.active
+
+    def start(self, mode, duration, top=10, on_finish=None):
+        """
+        Starts profiling for duration seconds.
+        Returns False if profiling is already active or the mode is invalid.
+
+        ...
+
+        Parameters
+        ----------
+        mode: str
+            Either "sampling" or "deterministic"
+
+        duration: float
+            Number of seconds to profile for
+
+        top: int
+            Number of functions to list within the report, at most MAX_TOP
+
+        on_finish: function, optional
+            Called with the report str once the window elapses
+        """
+
+        with self.lock:
+            if self.active or mode not in Profiler.MODES:
+                return False
+
+            self.mode = mode
+            self.top = min(top, Profiler.MAX_TOP)
+            self.on_finish = on_finish
+            self.timings = {}
+            self.stats = None
+            self.self_samples = Counter()
+            self.cumulative_samples = Counter()
+            self.stacks = Counter()
+            self.sample_count = 0
+            self.started = time.perf_counter()
+            self.active = True
+
+            if mode == "sampling":
+                self.sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self.sampler.start()
+
+            self.timer = threading.Timer(duration, self._finish)
+            self.timer.daemon = True
+            self.timer.start()
+
+        self.logger.warning("Started {} profiling for {} seconds".format(mode, duration))
+        return True
+
+    def stop(self):
+        """
+        Stops profiling early, returning the report. Returns None if profiling was not active.
+        """
+
+        with self.lock:
+            if not self.active:
+                return None
+            self.timer.cancel()
+            self.on_finish = None
+
+        return self._finish()
+
+    def call(self, plugin_name, func, *args):
+        """
+        Calls func with args and returns its result.
+        While profiling is active, the time taken is recorded against plugin_name.
+        """
+
+        if not self.active:
+            return func(*args)
+
+        profile = cProfile.Profile() if self.mode == "deterministic" else None
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.calling[thread_id] += 1
+        start = time.perf_counter()
+
+        try:
+            if profile:
+                return profile.runcall(func, *args)
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+
+            with self.lock:
+                self.calling[thread_id] -= 1
+                if not self.calling[thread_id]:
+                    del self.calling[thread_id]
+
+                if self.active:
+                    timing = self.timings.setdefault(plugin_name, [0, 0.0])
+                    timing[0] += 1
+                    timing[1] += elapsed
+
+                    if profile:
+                        if self.stats is None:
+                            self.stats = pstats.Stats(profile)
+                        else:
+                            self.stats.add(profile)
+
+    def _sample_loop(self):
+        while self.active:
+            # Only threads running a plugin are sampled, idle threads waiting on queues and events would otherwise
+            # fill the report
+            with self.lock:
+                calling = set(self.calling)
+            frames = sys._current_frames()
+
+            for thread_id in calling:
+                frame = frames.get(thread_id)
+
+                # Frames above call() belong to the bot rather than the plugin
+                stack = []
+                while frame is not None and frame.f_code is not Profiler.call.__code__:
+                    code = frame.f_code
+                    stack.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+
+                if not stack:
+                    continue
+
+                with self.lock:
+                    self.sample_count += 1
+                    self.self_samples[stack[0]] += 1
+                    self.cumulative_samples.update(set(stack))
+                    self.stacks[";".join(reversed(stack))] += 1
+
+            time.sleep(self.sample_interval)
+
+    def _finish(self):
+        with self.lock:
+            if not self.active:
+                return None
+            self.active = False
+            elapsed = time.perf_counter() - self.started
+            on_finish = self.on_finish
+
+        if self.sampler:
+            self.sampler.join()
+            self.sampler = None
+
+        path = self._write_profile()
+        report = self._report(elapsed, path)
+        self.logger.warning("Finished profiling, full profile written to {}".format(path))
+
+        if on_finish:
+            on_finish(report)
+        return report
+
+    def _write_profile(self):
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        name = time.strftime("%Y%m%d-%H%M%S")
+
+        if self.mode == "deterministic":
+            path = os.path.join(self.output_dir, name + ".prof")
+            if self.stats is not None:
+                self.stats.dump_stats(path)
+            else:
+                open(path, "wb").close()
+        else:
+            # Collapsed stacks, readable by flamegraph tools
+            path = os.path.join(self.output_dir, name + ".folded")
+            with open(path, "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write("{} {}\n".format(stack, count))
+        return path
+
+    def _report(self, elapsed, path):
+        report = "Profiled ({}) for {:.1f}s\n\nPlugin time:\n".format(self.mode, elapsed)
+
+        if self.timings:
+            for name, (calls, seconds) in sorted(self.timings.items(), key=lambda x: x[1][1], reverse=True):
+                report += "{}: {:.3f}s over {} calls\n".format(name, seconds, calls)
+        else:
+            report += "No plugin calls were made\n"
+
+        report += "\nTop {} functions:\n".format(self.top)
+
+        lines = []
+        if self.mode == "deterministic":
+            if self.stats is not None:
+                stream = io.StringIO()
+                self.stats.stream = stream
+                self.stats.sort_stats("cumulative").print_stats(self.top)
+                # Only keep the table, pstats prefixes it with a header describing the files read
+                table = stream.getvalue()
+                lines = (table[table.find("ncalls"):] if "ncalls" in table else table).rstrip().splitlines()
+        else:
+            for function, count in self.cumulative_samples.most_common(self.top):
+                lines.append("{:.1f}% cum, {:.1f}% self - {}".format(100 * count / self.sample_count,
+                                                                    100 * self.self_samples[function] / self.sample_count,
+                                                                    function))
+
+        footer = "\nFull profile: {}".format(path)
+        # The last functions are left out rather than the report being split over several messages
+        while lines and len(report) + sum(len(line) + 1 for line in lines) + len(footer) > Profiler.MAX_REPORT_LENGTH:
+            lines.pop()
+        return report + "".join(line + "\n" for line in lines) + footer
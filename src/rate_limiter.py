@@ -0,0 +1,50 @@
+import threading
+import time
+
+class RateLimiter:
+	"""
+	Thread safe rate limiter spacing requests out to at most rate per second, allowing short bursts.
+
+	...
+
+	Methods
+	-------
+	reserve()
+		Reserves the next free slot and returns the number of seconds the caller must wait before using it.
+
+	set_rate(rate)
+		Changes the number of requests allowed per second. A rate of 0 disables the limit.
+	"""
+
+	def __init__(self, rate, burst=5):
+		"""
+		Parameters
+		----------
+		rate: float
+			Maximum requests per second, 0 disables the limit
+
+		burst: int
+			Number of requests that may be made back to back before spacing is enforced
+		"""
+
+		self.lock = threading.Lock()
+		self.rate = rate
+		self.burst = burst
+		# Theoretical time at which the next request would be sent if requests were perfectly spaced
+		self.next_time = 0.0
+
+	def set_rate(self, rate):
+		with self.lock:
+			self.rate = rate
+
+	def reserve(self):
+		with self.lock:
+			if self.rate <= 0:
+				return 0
+
+			now = time.monotonic()
+			interval = 1.0 / self.rate
+			next_time = max(self.next_time, now)
+			self.next_time = next_time + interval
+
+			return max(0.0, next_time - now - (self.burst - 1) * interval)
@@ -0,0 +1,358 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+
+from libs.store import Store
+
+class Cache:
+    """
+    Thread safe least recently used cache with an optional time to live shared between plugins.
+    Plugins should prefix keys with their own name to avoid collisions.
+
+    ...
+
+    Methods
+    -------
+    get(key, default)
+        Returns the value cached under key, or default if it is missing or expired
+
+    set(key, value, ttl)
+        Caches value under key, evicting the least recently used entry when full
+
+    delete(key)
+        Removes key from the cache
+
+    clear()
+        Removes every entry from the cache
+
+    resize(max_entries)
+        Changes the size of the cache, evicting the least recently used entries beyond it
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # Map of keys to (expiry time or None, value) in least to most recently used order
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl if ttl else None, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def resize(self, max_entries):
+        with self.lock:
+            self.max_entries = max_entries
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class ResizableExecutor(Executor):
+    """
+    Executor handing work to an inner pool that is replaced when the number of workers changes, so plugins may
+    keep a reference to it across config reloads. Work already submitted to a replaced pool is left to finish.
+
+    ...
+
+    Methods
+    -------
+    submit(fn, *args, **kwargs)
+        Schedules fn on the current pool, returning a Future
+
+    resize(workers)
+        Replaces the pool with one of the given size
+
+    shutdown(wait, cancel_futures)
+        Shuts the current pool down, after which nothing more may be submitted
+    """
+
+    def __init__(self, factory, workers):
+        """
+        Parameters
+        ----------
+        factory: function
+            Called with a number of workers to create a pool
+
+        workers: int
+            Initial number of workers
+        """
+
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.pool = factory(workers)
+        self.closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            return self.pool.submit(fn, *args, **kwargs)
+
+    def resize(self, workers):
+        with self.lock:
+            old, self.pool = self.pool, self.factory(workers)
+        old.shutdown(wait=False)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self.lock:
+            self.closed = True
+        self.pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+class DatabasePool:
+    """
+    Fixed size pool of SQLite connections (in WAL mode) to a single database file.
+
+    ...
+
+    Methods
+    -------
+    connection()
+        Context manager lending a connection from the pool, committing on success and rolling back on error
+
+    close()
+        Closes every connection in the pool
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.connections = queue.Queue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    @contextmanager
+    def connection(self):
+        db = self._acquire()
+        try:
+            with db:
+                yield db
+        finally:
+            self._release(db)
+
+    def resize(self, size):
+        """
+        Changes the maximum number of connections, closing surplus connections as they are returned.
+        """
+
+        with self.lock:
+            self.size = size
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _acquire(self):
+        with self.lock:
+            if self.closed:
+                raise Exception("Database pool for {} has been closed".format(self.path))
+            try:
+                return self.connections.get_nowait()
+            except queue.Empty:
+                if self.created < self.size:
+                    self.created += 1
+                    db = sqlite3.connect(self.path, check_same_thread=False)
+                    db.execute("PRAGMA journal_mode=WAL")
+                    return db
+        return self.connections.get()
+
+    def _release(self, db):
+        with self.lock:
+            if self.closed or self.created > self.size:
+                self.created -= 1
+                db.close()
+                return
+        self.connections.put(db)
+
+
+class Resources:
+    """
+    Resources shared by every Plugin, created on first use and closed by the PluginManager when the bot shuts down.
+    Passed to the constructor of plugins accepting a third resources parameter, and kept across plugin reloads.
+
+    ...
+
+    Methods
+    -------
+    http_session()
+        Returns a requests Session with a connection pool shared between all plugins
+
+    database(path)
+        Returns the DatabasePool for the SQLite database found at path
+
+    executor()
+        Returns a thread pool plugins may submit background work to, which stays usable when it is resized
+
+    process_executor()
+        Returns a process pool plugins may submit CPU heavy work to, which stays usable when it is resized
+
+    store(path)
+        Opens a write-behind key-value Store whose flushing follows the config
+
+    shared(name, factory)
+        Returns the single object registered under name, creating it with factory on first use
+
+    close()
+        Closes every resource that has been created
+
+    on_config_reload(config, changed)
+        Resizes pools, the cache and stores after the configuration file has been reloaded
+    """
+
+    def __init__(self, config):
+        """
+        Parameters
+        ----------
+        config: Config
+            Configuration object, used to size the pools
+        """
+
+        self.logger = logging.getLogger('bot_log')
+        self.config = config
+        self.workers = config.workers
+        self.lock = threading.Lock()
+        # Cache shared by all plugins
+        self.cache = Cache(config.cache_size)
+        # List of Stores opened through store()
+        self._stores = []
+        self._session = None
+        self._executor = None
+        self._process_executor = None
+        # Map of absolute database paths to DatabasePools
+        self._databases = {}
+        # Map of names to objects created through shared()
+        self._shared = {}
+
+        config.subscribe(self.on_config_reload)
+
+    def http_session(self):
+        with self.lock:
+            if self._session is None:
+                import requests
+
+                self._session = requests.Session()
+                self._mount_adapter()
+            return self._session
+
+    def _mount_adapter(self):
+        import requests
+
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def database(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            if path not in self._databases:
+                self._databases[path] = DatabasePool(path, self.workers)
+            return self._databases[path]
+
+    def executor(self):
+        with self.lock:
+            if self._executor is None:
+                self._executor = ResizableExecutor(
+                    lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resources"), self.workers)
+            return self._executor
+
+    def process_executor(self):
+        with self.lock:
+            if self._process_executor is None:
+                self._process_executor = ResizableExecutor(lambda workers: ProcessPoolExecutor(max_workers=workers),
+                                                           self.workers)
+            return self._process_executor
+
+    def store(self, path):
+        with self.lock:
+            self._stores = [store for store in self._stores if not store.closed]
+            store = Store(path, self.config.store_flush_interval, self.config.store_batch_size)
+            self._stores.append(store)
+            return store
+
+    def shared(self, name, factory):
+        with self.lock:
+            if name not in self._shared:
+                self._shared[name] = factory()
+            return self._shared[name]
+
+    def on_config_reload(self, config, changed):
+        with self.lock:
+            self.cache.resize(config.cache_size)
+
+            for store in self._stores:
+                store.flush_interval = config.store_flush_interval
+                store.batch_size = config.store_batch_size
+
+            if "workers" not in changed:
+                return
+
+            self.workers = config.workers
+            for pool in self._databases.values():
+                pool.resize(self.workers)
+            if self._session is not None:
+                self._mount_adapter()
+            # Plugins holding on to the executors keep using them, now backed by pools of the new size
+            if self._executor is not None:
+                self._executor.resize(self.workers)
+            if self._process_executor is not None:
+                self._process_executor.resize(self.workers)
+
+        self.logger.info("Resized shared resources to {} workers".format(config.workers))
+
+    def close(self):
+        with self.lock:
+            for name, obj in self._shared.items():
+                if hasattr(obj, "close"):
+                    try:
+                        obj.close()
+                    except Exception:
+                        self.logger.exception("Unable to close shared resource {}".format(name))
+            for pool in self._databases.values():
+                pool.close()
+            if self._session is not None:
+                self._session.close()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            if self._process_executor is not None:
+                self._process_executor.shutdown(wait=False)
+
+            self._shared = {}
+            self._databases = {}
+            self._session = None
+            self._executor = None
+            self._process_executor = None
+            self.cache.clear()
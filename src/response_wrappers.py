@@ -12,6 +12,10 @@ class Responses:
     respond_photo()
         Returns a formated dictionary indicating a photo response type, and optional str caption
         and the path to the photo file_path
+
+    respond_photo_data()
+        Returns a formated dictionary indicating a photo response type, and optional str caption
+        and the photo's contents as bytes
     """
 
     @staticmethod
@@ -47,4 +51,24 @@ class Responses:
 
         if not caption_str:
             return {"type": "photo", "caption": "", "file_name": file_path}
-        return {"type": "photo", "caption": caption_str, "file_name": file_path}
\ No newline at end of file
+        return {"type": "photo", "caption": caption_str, "file_name": file_path}
+
+    @staticmethod
+    def respond_photo_data(caption_str, data, file_name="photo.jpg"):
+        """
+        Returns a formated dictionary indicating a photo response type, and optional str caption
+        and the photo's contents as bytes, which are sent without being written to disk
+
+        ...
+
+        Parameters
+        ----------
+        caption_str: str
+            A str message to be captioned under a photo
+        data: bytes
+            The encoded photo to be sent
+        file_name: str
+            The name the photo is uploaded under
+        """
+
+        return {"type": "photo", "caption": caption_str if caption_str else "", "file_name": file_name, "data": data}
@@ -1,5 +1,8 @@
+import asyncio
 import logging
 import os
+import signal
+import sys
 import threading
 import time
 
@@ -81,6 +84,30 @@ if os.path.exists("config.txt"):
 else:
 	conf = ConfigWizard("config.txt").conf
 
+# Reread config.txt on SIGHUP (where supported), resizing pools and limiters without a restart
+def reload_config(signum, frame):
+    try:
+        conf.reload()
+    except Exception:
+        logger.exception("Unable to reload config, nothing was changed")
+
+if hasattr(signal, "SIGHUP"):
+    signal.signal(signal.SIGHUP, reload_config)
+
+# Run the bot on an asyncio event loop rather than a BotThread if requested
+if conf.runtime == "async":
+    from async_bot import AsyncBot
+
+    bot = AsyncBot(conf)
+    logger.info("Running bot on the async runtime")
+
+    try:
+        asyncio.run(bot.run())
+    except KeyboardInterrupt:
+        logger.warning("Bot shutdown due to keyboard interrupt.")
+    bot.shutdown()
+    sys.exit(0)
+
 # Create and start the bot
 bot = Bot(conf)
 
@@ -110,4 +137,5 @@ logger.warning("Bot shutdown due to killed thread.")
 
 # Close bot thread
 thread.stop()
-thread.join()
\ No newline at end of file
+thread.join()
+bot.shutdown()
\ No newline at end of file
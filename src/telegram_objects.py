@@ -69,11 +69,11 @@ class User:
 		"""
 
 		self.id = user["id"]
-		self.is_bot = user["is_bot"]
-		self.first_name = user["first_name"]
-		self.last_name = user["last_name"]
+		self.is_bot = user.get("is_bot", False)
+		self.first_name = user.get("first_name", "")
+		self.last_name = user.get("last_name")
 		self.username = user["username"] if "username" in user else self.first_name
-		self.language_code = user["language_code"]
+		self.language_code = user.get("language_code")
 
 
 class Chat:
@@ -99,10 +99,10 @@ class Chat:
 
 		self.id = chat["id"]
 		self.type = chat["type"]
-		self.title = chat["title"]
-		self.username = chat["username"]
-		self.first_name = chat["first_name"]
-		self.last_name = chat["last_name"]
+		self.title = chat.get("title")
+		self.username = chat.get("username")
+		self.first_name = chat.get("first_name")
+		self.last_name = chat.get("last_name")
 
 		"""
 		Still need to implement the following due to missing dependencies:
@@ -154,17 +154,18 @@ class Message:
 		self.sent_from = User(message["from"])
 		self.date = message["date"]
 		self.chat = Chat(message["chat"])
-		self.forward_from = User(message["forward_from"])
-		self.forward_from_chat = Chat(message["forward_from_chat"])
-		self.forward_from_message_id = message["forward_from_message_id"]
-		self.forward_signature = message["forward_signature"]
-		self.forward_sender_name = message["forward_sender_name"]
-		self.forward_date = message["forward_date"]
-		self.reply_to_message = Message(message["reply_to_message"])
-		self.edit_date = message["edit_date"]
-		self.media_group_id = message["media_group_id"]
-		self.author_signature = message["author_signature"]
-		self.raw_text = message["text"]
+		# Telegram leaves out optional fields that are not set
+		self.forward_from = User(message["forward_from"]) if "forward_from" in message else None
+		self.forward_from_chat = Chat(message["forward_from_chat"]) if "forward_from_chat" in message else None
+		self.forward_from_message_id = message.get("forward_from_message_id")
+		self.forward_signature = message.get("forward_signature")
+		self.forward_sender_name = message.get("forward_sender_name")
+		self.forward_date = message.get("forward_date")
+		self.reply_to_message = Message(message["reply_to_message"]) if "reply_to_message" in message else None
+		self.edit_date = message.get("edit_date")
+		self.media_group_id = message.get("media_group_id")
+		self.author_signature = message.get("author_signature")
+		self.raw_text = message.get("text", "")
 		self.text = message["text"].strip() if "text" in message else ""
 		"""
 		Still need to implement the following due to further dependencies:
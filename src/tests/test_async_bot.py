@@ -0,0 +1,247 @@
+"""
+Runs AsyncBot against a fake Telegram Bot API server listening on api_url.
+
+Run from the src directory: python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_bot import AsyncBot
+from config import Config
+
+TOKEN = "123:test"
+
+
+def text_update(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "from": {"id": 7, "is_bot": False, "first_name": "Tester", "username": "tester"},
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        },
+    }
+
+
+class FakeTelegram:
+    """
+    Bot API server on its own event loop and thread, so the bot's blocking getMe request can reach it.
+
+    getUpdates long polls like Telegram, returning updates from offset onwards or waiting up to timeout seconds
+    for new ones. Every request is recorded as (method, fields).
+    """
+
+    def __init__(self):
+        self.updates = []
+        self.requests = []
+        # Error replies returned, in order, by the next getUpdates requests
+        self.errors = []
+        self.loop = asyncio.new_event_loop()
+        self.added = None
+        self.runner = None
+        self.url = None
+        self.closing = False
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(5)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+    def add_update(self, update):
+        def add():
+            self.updates.append(update)
+            self.added.set()
+        self.loop.call_soon_threadsafe(add)
+
+    def calls(self, method):
+        return [fields for name, fields in list(self.requests) if name == method]
+
+    async def _start(self):
+        self.added = asyncio.Event()
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = "http://127.0.0.1:{}".format(self.runner.addresses[0][1])
+
+    async def _stop(self):
+        # Polls still held open are answered so the server does not wait on them to shut down
+        self.closing = True
+        self.added.set()
+        await self.runner.cleanup()
+
+    async def handle(self, request):
+        if request.match_info["token"] != TOKEN:
+            return web.json_response({"ok": False}, status=401)
+
+        method = request.match_info["method"]
+        fields = dict(request.query)
+        if request.method == "POST":
+            fields.update(await request.post())
+        self.requests.append((method, fields))
+
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "username": "test_bot"}})
+        if method == "getUpdates" and self.errors:
+            error = self.errors.pop(0)
+            return web.json_response(error, status=error["error_code"])
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self.get_updates(fields)})
+        return web.json_response({"ok": True, "result": True})
+
+    async def get_updates(self, fields):
+        offset = int(fields.get("offset", 0))
+        deadline = self.loop.time() + float(fields.get("timeout", 0))
+
+        while True:
+            found = [update for update in self.updates if update["update_id"] >= offset]
+            remaining = deadline - self.loop.time()
+            if found or remaining <= 0 or self.closing:
+                return found
+
+            self.added.clear()
+            try:
+                await asyncio.wait_for(self.added.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+@pytest.fixture
+def server():
+    server = FakeTelegram()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def config(server, tmp_path):
+    config = Config()
+    config.token = TOKEN
+    config.api_url = server.url
+    config.bot_dir = str(tmp_path)
+    config.plugins = ["dad"]
+    config.runtime = "async"
+    # Long enough that stop() has to cancel a poll held open by the server
+    config.poll_timeout = 30
+    config.request_timeout = 5.0
+    config.sleep_interval = 0
+    config.send_rate_limit = 0.0
+    config.workers = 2
+    return config
+
+
+async def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the bot")
+        await asyncio.sleep(0.01)
+
+
+def test_updates_are_dispatched_to_plugins_and_replies_sent(server, config):
+    server.add_update(text_update(1, 42, "I'm testing"))
+    server.add_update(text_update(2, 43, "/nosuchcommand"))
+    bot = AsyncBot(config)
+
+    async def scenario():
+        running = asyncio.create_task(bot.run())
+        await wait_for(lambda: len(server.calls("sendMessage")) == 2)
+
+        # A later update is only received once the offset has moved past those already handled
+        server.add_update(text_update(3, 42, "im back"))
+        await wait_for(lambda: len(server.calls("sendMessage")) == 3)
+        await wait_for(lambda: any(call["offset"] == "4" for call in server.calls("getUpdates")))
+
+        started = time.monotonic()
+        bot.stop()
+        await asyncio.wait_for(running, 5)
+        return time.monotonic() - started
+
+    try:
+        stop_time = asyncio.run(scenario())
+    finally:
+        bot.shutdown()
+
+    replies = {(call["chat_id"], call["text"]) for call in server.calls("sendMessage")}
+    assert replies == {
+        ("42", "Hi testing, I'm dad!"),
+        ("43", "Invalid command!\n'nosuchcommand'"),
+        ("42", "Hi back, I'm dad!"),
+    }
+
+    offsets = [int(call["offset"]) for call in server.calls("getUpdates")]
+    assert offsets[0] == 1
+    assert offsets == sorted(offsets)
+    assert offsets[-1] == 4
+
+    # Stopping cancels the held poll instead of waiting out poll_timeout
+    assert stop_time < config.poll_timeout / 2
+    assert bot.session is None
+    assert not bot.senders
+    assert not bot.pending
+
+
+def test_stop_before_any_update(server, config):
+    bot = AsyncBot(config)
+
+    async def scenario():
+        running = asyncio.create_task(bot.run())
+        await wait_for(lambda: server.calls("getUpdates"))
+        bot.stop()
+        await asyncio.wait_for(running, 5)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        bot.shutdown()
+
+    assert not server.calls("sendMessage")
+    assert bot.session is None
+
+
+def test_polling_continues_after_telegram_errors(server, config):
+    server.errors.append({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                          "parameters": {"retry_after": 1}})
+    server.errors.append({"ok": False, "error_code": 429})
+    server.add_update(text_update(1, 42, "I'm still here"))
+    bot = AsyncBot(config)
+
+    async def scenario():
+        running = asyncio.create_task(bot.run())
+        await wait_for(lambda: server.calls("sendMessage"))
+        bot.stop()
+        await asyncio.wait_for(running, 5)
+
+    started = time.monotonic()
+    try:
+        asyncio.run(scenario())
+    finally:
+        bot.shutdown()
+
+    assert [(call["chat_id"], call["text"]) for call in server.calls("sendMessage")] == [("42", "Hi still here, I'm dad!")]
+    # Two refused polls then the one receiving the update, each retried at the same offset
+    assert [call["offset"] for call in server.calls("getUpdates")][:3] == ["1", "1", "1"]
+    # retry_after (1 second) was honoured, then the backoff of at least 1 second
+    assert time.monotonic() - started >= 2
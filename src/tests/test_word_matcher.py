@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.word_matcher import WordMatcher
+
+
+def test_finds_earliest_word_ignoring_case():
+    matcher = WordMatcher(["hello", "Help", "world"])
+
+    assert matcher.search("Say WORLD then hello") == "world"
+    assert matcher.search("please HELP me") == "Help"
+    assert matcher.search("helpful hellos") is None
+
+
+def test_words_are_matched_literally():
+    matcher = WordMatcher(["c++", "a.b"])
+
+    assert matcher.search("I write C++ daily") == "c++"
+    assert matcher.search("axb") is None
+
+
+def test_characters_matching_through_case_folding():
+    # The long s (U+017F) and the Kelvin sign (U+212A) match 's' and 'k' when ignoring case
+    matcher = WordMatcher(["kiss"])
+
+    assert matcher.search("Kiſs now") == "kiss"
+    assert matcher.search("Kiss now") == "kiss"
+
+
+def test_words_with_special_lower_case():
+    matcher = WordMatcher(["Straße"])
+
+    assert matcher.search("die STRASSE hier") is None
+    assert matcher.search("die straße hier") == "Straße"
+
+
+def test_removed_words_are_no_longer_found():
+    matcher = WordMatcher(["cat", "category"])
+    matcher.remove("cat")
+
+    assert matcher.search("a cat") is None
+    assert matcher.search("a category") == "category"